@@ -0,0 +1,125 @@
+import argparse
+import time
+import numpy as np
+import export
+import heightfield
+import perlin
+import profiling
+import resultcache
+import rtin
+import terrain
+
+# Generacion de terrenos por lotes, sin ventanas: solo depende de NumPy (no
+# importa pyvista ni matplotlib), para correr muchos trabajos en maquinas sin
+# pantalla. Ejemplo:
+#   python batch.py terreno.npy --seed 1234 -n 1000 --octaves 8
+
+
+def generate(n, octaves, persistence, lacunarity, offsets, workers=1, cache=None):
+    """
+    Alturas escaladas del terreno sobre la grilla n x n, igual que en el visor.
+    :param workers: Procesos a usar (ver terrain.parallel_terrain_heights).
+    :param cache: ResultCache opcional; comparte los resultados con el visor.
+    :return: Arreglo (n, n) de alturas, fila por fila.
+    """
+    def compute():
+        if workers > 1:
+            return terrain.parallel_terrain_heights(n, octaves, persistence, lacunarity,
+                                                    offsets, workers=workers)
+        return terrain.terrain_heights(n, octaves, persistence, lacunarity, offsets)
+
+    if cache is None:
+        z = compute()
+    else:
+        z = cache.cached("terrain_heights", compute, resultcache.code_version(perlin, terrain),
+                         **terrain.terrain_cache_params(n, octaves, persistence, lacunarity,
+                                                        offsets))
+    return z.reshape(n, n)
+
+def save(path, heights, dtype="uint16", max_error=None, **meta):
+    """
+    Guarda el terreno segun la extension de `path`:
+    .hf: mapa de alturas compacto con los metadatos (ver heightfield.py).
+    .npy: mapa de alturas (n, n) en float32.
+    .npz: malla con "points" (n*n, 3) y "faces" (2*(n-1)^2, 3), o la malla
+          simplificada de rtin.py si se indica max_error.
+    .ply, .stl, .glb: la misma malla en formato binario (ver export.py).
+    :param dtype: Tipo de dato para .hf ("float32", "float16" o "uint16").
+    :param max_error: Error vertical maximo de la malla simplificada; las
+                      alturas deben ser de (2^k + 1) x (2^k + 1).
+    :param meta: Metadatos para el encabezado de .hf.
+    """
+    n = heights.shape[0]
+    if path.endswith(".hf"):
+        heightfield.save_heightfield(path, heights, dtype, **meta)
+    elif path.endswith((".npz",) + tuple(export.WRITERS)):
+        if max_error is None:
+            points, faces = np.c_[terrain.grid_points(n), heights.ravel()], terrain.grid_faces(n)
+        else:
+            points, faces = rtin.rtin_mesh(heights, max_error)
+        points = points.astype(np.float32)
+        faces = faces.reshape(-1, 4)[:, 1:].astype(np.uint32)
+        if path.endswith(".npz"):
+            np.savez(path, points=points, faces=faces)
+        else:
+            export.write_mesh(path, points, faces)
+    elif path.endswith(".npy"):
+        np.save(path, heights.astype(np.float32))
+    else:
+        raise ValueError(f"Formato de salida no soportado: {path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un terreno sin abrir ventanas.")
+    parser.add_argument("output",
+                        help="Archivo de salida (.hf o .npy mapa de alturas, "
+                             ".npz, .ply, .stl o .glb malla)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla de los desplazamientos (por defecto, la hora actual)")
+    parser.add_argument("--offset-x", type=int, default=None,
+                        help="Desplazamiento x del ruido (por defecto, derivado de la semilla)")
+    parser.add_argument("--offset-y", type=int, default=None,
+                        help="Desplazamiento y del ruido (por defecto, derivado de la semilla)")
+    parser.add_argument("-n", "--resolution", type=int, default=200)
+    parser.add_argument("--octaves", type=int, default=4)
+    parser.add_argument("--persistence", type=float, default=0.4)
+    parser.add_argument("--lacunarity", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para generar la grilla en paralelo")
+    parser.add_argument("--dtype", choices=sorted(heightfield.DTYPES), default="uint16",
+                        help="Tipo de dato de las alturas en archivos .hf")
+    parser.add_argument("--max-error", type=float, default=None,
+                        help="Simplificar la malla con este error vertical maximo "
+                             "(la resolucion se lleva a 2^k + 1, ver rtin.py)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No leer ni guardar el resultado en la cache en disco "
+                             "(ver resultcache.py)")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="JSON",
+                        help="Medir las etapas e imprimir sus tiempos al terminar, "
+                             "guardandolos tambien en JSON si se indica un archivo "
+                             "(ver profiling.py)")
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        profiling.enable(json_path=args.profile or None)
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    offset_x, offset_y = terrain.offsets_from_seed(seed)
+    if args.offset_x is not None:
+        offset_x = args.offset_x
+    if args.offset_y is not None:
+        offset_y = args.offset_y
+
+    n = args.resolution
+    if args.max_error is not None:
+        n = rtin.rtin_size(n)
+    cache = None if args.no_cache else resultcache.ResultCache()
+    with profiling.timer("batch.generate"):
+        heights = generate(n, args.octaves, args.persistence, args.lacunarity,
+                           (offset_x, offset_y), args.workers, cache)
+    with profiling.timer("batch.save"):
+        save(args.output, heights, args.dtype, args.max_error, seed=seed, offset_x=offset_x,
+             offset_y=offset_y, octaves=args.octaves, persistence=args.persistence,
+             lacunarity=args.lacunarity)
+    print(f"{args.output}: semilla={seed} offset_x={offset_x} offset_y={offset_y}")
+
+if __name__ == "__main__":
+    main()
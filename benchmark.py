@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import fractals
+import terrain
+
+# rama importa matplotlib.pyplot; sin pantalla se usa un backend sin ventanas
+os.environ.setdefault("MPLBACKEND", "Agg")
+import rama
+
+# Benchmarks de generacion, sin abrir ventanas. Cada caso se mide varias veces
+# (se guarda el mejor tiempo) y una vez mas con tracemalloc para obtener el
+# pico de memoria. Ejemplo:
+#   python benchmark.py resultados.json --baseline benchmark_baseline.json
+#   python benchmark.py benchmark_baseline.json --suite fractals   (nueva base)
+
+TERRAIN_RESOLUTIONS = (100, 200, 500, 1000)
+TERRAIN_OCTAVES = (1, 4, 8)
+FRACTAL_LEVELS = range(10)
+FERN_POINTS = (10**4, 10**5, 10**6, 10**7)
+
+
+def terrain_case(n, octaves):
+    """
+    Lo que hace main2.generate_terrain antes de crear el pv.PolyData:
+    alturas, puntos 3D y caras de la grilla (sin las caches de la grilla).
+    """
+    def run():
+        terrain.grid_points.cache_clear()
+        terrain.grid_faces.cache_clear()
+        z = terrain.terrain_heights(n, octaves, 0.4, 3.0, (1234, 5678))
+        np.c_[terrain.grid_points(n), z]
+        terrain.grid_faces(n)
+    return f"terrain n={n} octaves={octaves}", run, n * n
+
+def fractal_case(generate, level):
+    def run():
+        generate(n=level)
+    return f"{generate.__name__} level={level}", run, 4 * 4**level
+
+def fern_case(n):
+    def run():
+        rama.barnsley_fern(n, seed=0)
+    return f"barnsley_fern n={n}", run, n
+
+def suites():
+    """
+    Casos de cada suite como (nombre, funcion, puntos generados).
+    """
+    return {
+        "terrain": [terrain_case(n, o) for n in TERRAIN_RESOLUTIONS for o in TERRAIN_OCTAVES],
+        "fractals": [fractal_case(g, level)
+                     for g in (fractals.generate_sierpinsky3D, fractals.generate_tetrahedron)
+                     for level in FRACTAL_LEVELS],
+        "fern": [fern_case(n) for n in FERN_POINTS],
+    }
+
+def measure(run, points, repeat=3):
+    """
+    Mide un caso.
+    :param run: Funcion sin argumentos a medir.
+    :param points: Puntos que genera cada llamada.
+    :param repeat: Veces que se mide el tiempo; se guarda el menor.
+    :return: Diccionario con wall_s, peak_mb, points y points_per_s.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    # El pico de memoria se mide aparte porque tracemalloc hace mas lento el codigo
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    wall = min(times)
+    return {"wall_s": wall, "peak_mb": peak / 2**20, "points": points,
+            "points_per_s": points / wall if wall > 0 else float("inf")}
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compara los resultados con una base guardada e imprime una tabla.
+    :param tolerance: Aumento relativo de tiempo o memoria permitido; ademas se
+                      toleran 1 ms y 0.1 MB para que los casos muy cortos no
+                      fallen por ruido.
+    :return: Lista de nombres de los casos que empeoraron.
+    """
+    regressions = []
+    print(f"{'caso':40} {'tiempo':>10} {'base':>10} {'razon':>7} {'MB':>9} {'base':>9}")
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            print(f"{name:40} {r['wall_s']:10.4f} {'-':>10} {'-':>7} {r['peak_mb']:9.1f} {'-':>9}")
+            continue
+        ratio = r["wall_s"] / b["wall_s"] if b["wall_s"] > 0 else 1.0
+        worse = (r["wall_s"] > b["wall_s"] * (1 + tolerance) + 1e-3
+                 or r["peak_mb"] > b["peak_mb"] * (1 + tolerance) + 0.1)
+        if worse:
+            regressions.append(name)
+        print(f"{name:40} {r['wall_s']:10.4f} {b['wall_s']:10.4f} {ratio:7.2f} "
+              f"{r['peak_mb']:9.1f} {b['peak_mb']:9.1f}{'  <- peor' if worse else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide la generacion de terrenos y fractales.")
+    parser.add_argument("output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", default=None,
+                        help="Resultados JSON de referencia con los que comparar")
+    parser.add_argument("--suite", action="append", choices=sorted(suites()),
+                        help="Suite a medir (se puede repetir; por defecto, todas)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Veces que se mide cada caso (se guarda el menor tiempo)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Aumento relativo permitido respecto de la base")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for suite, cases in suites().items():
+        if args.suite and suite not in args.suite:
+            continue
+        for name, run, points in cases:
+            results[name] = measure(run, points, args.repeat)
+            r = results[name]
+            print(f"{name:40} {r['wall_s']:10.4f} s {r['peak_mb']:9.1f} MB "
+                  f"{r['points_per_s']:14.0f} puntos/s", flush=True)
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} casos empeoraron respecto de {args.baseline}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+import fractals
+
+# Exportacion de mallas de triangulos a formatos binarios (PLY, STL y glTF
+# binario .glb), escribiendo los arreglos de NumPy de una vez en lugar de
+# triangulo por triangulo. Las mallas se pueden escribir por partes desde un
+# iterador de (vertices, caras), como fractals.sierpinsky_chunks, asi que un
+# fractal de nivel 12 (16M tetraedros) se exporta sin tenerlo completo en
+# memoria: los encabezados se reservan al principio y se completan al final,
+# cuando ya se conocen los totales, y las caras de PLY y glTF (que van despues
+# de todos los vertices) se guardan mientras tanto en un archivo temporal.
+# Ejemplo:
+#   python export.py sierpinsky.ply --fractal sierpinsky --level 12
+
+# Bytes reservados para los encabezados de texto que se completan al final
+PLY_HEADER_SIZE = 512
+GLB_JSON_SIZE = 1024
+
+# Bytes copiados a la vez desde el archivo temporal de caras
+COPY_SIZE = 2**24
+
+# Registros binarios de cada formato
+PLY_FACE = np.dtype([("n", "u1"), ("v", "<i4", 3)])
+STL_TRIANGLE = np.dtype([("normal", "<f4", 3), ("v", "<f4", (3, 3)), ("attribute", "<u2")])
+
+
+def triangles(faces):
+    """
+    Caras como arreglo (m, 3), aceptando tambien el formato de PyVista
+    [3, a, b, c, 3, ...] de las mallas de main2.py y rtin.py.
+    """
+    faces = np.asarray(faces)
+    if faces.ndim == 1:
+        faces = faces.reshape(-1, 4)[:, 1:]
+    return faces
+
+def mesh_arrays(mesh):
+    """
+    Vertices y caras (m, 3) de un pv.PolyData de triangulos.
+    """
+    return np.asarray(mesh.points), triangles(mesh.faces)
+
+def _spool(path):
+    # Archivo temporal junto a la salida (en el mismo disco, no en /tmp)
+    return tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+
+def _write(f, array):
+    f.write(np.ascontiguousarray(array).data)
+
+
+def stream_ply(path, chunks):
+    """
+    Escribe una malla en PLY binario little endian por partes.
+    :param path: Archivo de salida.
+    :param chunks: Iterable de (vertices (k, 3), caras (m, 3)), con los indices
+                   de cada parte relativos a sus propios vertices.
+    :return: (numero de vertices, numero de caras).
+    """
+    n_vertices = n_faces = 0
+    with open(path, "wb") as f, _spool(path) as spool:
+        f.write(b" " * PLY_HEADER_SIZE)
+        for vertices, faces in chunks:
+            faces = triangles(faces)
+            _write(f, np.asarray(vertices, dtype="<f4"))
+            records = np.empty(len(faces), dtype=PLY_FACE)
+            records["n"] = 3
+            records["v"] = faces.astype(np.int64) + n_vertices
+            _write(spool, records)
+            n_vertices += len(vertices)
+            n_faces += len(faces)
+        spool.seek(0)
+        shutil.copyfileobj(spool, f, COPY_SIZE)
+
+        head = (f"ply\nformat binary_little_endian 1.0\n"
+                f"element vertex {n_vertices}\n"
+                f"property float x\nproperty float y\nproperty float z\n")
+        tail = (f"element face {n_faces}\n"
+                f"property list uchar int vertex_indices\nend_header\n")
+        # Completar el espacio reservado con un comentario de relleno
+        padding = PLY_HEADER_SIZE - len(head) - len(tail) - len("comment \n")
+        f.seek(0)
+        f.write((head + "comment " + " " * padding + "\n" + tail).encode("ascii"))
+    return n_vertices, n_faces
+
+def stream_stl(path, chunks):
+    """
+    Escribe una malla en STL binario por partes (ver stream_ply). Cada
+    triangulo se guarda con su normal y sus tres vertices.
+    :return: Numero de triangulos.
+    """
+    count = 0
+    with open(path, "wb") as f:
+        f.write(b"Proyecto-Mallas-Geometricas".ljust(80) + struct.pack("<I", 0))
+        for vertices, faces in chunks:
+            corners = np.asarray(vertices, dtype=np.float32)[triangles(faces)]
+            normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            records = np.zeros(len(corners), dtype=STL_TRIANGLE)
+            records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals),
+                                          where=lengths > 0)
+            records["v"] = corners
+            _write(f, records)
+            count += len(corners)
+        f.seek(80)
+        f.write(struct.pack("<I", count))
+    return count
+
+def stream_glb(path, chunks):
+    """
+    Escribe una malla en glTF 2.0 binario (.glb) por partes (ver stream_ply):
+    un solo buffer con las posiciones float32 seguidas de los indices uint32.
+    :return: (numero de vertices, numero de caras).
+    """
+    n_vertices = n_faces = 0
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    start = 12 + 8 + GLB_JSON_SIZE + 8  # Encabezado, chunk JSON y encabezado del chunk BIN
+    with open(path, "wb") as f, _spool(path) as spool:
+        f.seek(start)
+        for vertices, faces in chunks:
+            vertices = np.asarray(vertices, dtype="<f4")
+            _write(f, vertices)
+            _write(spool, triangles(faces).astype("<u4") + np.uint32(n_vertices))
+            if len(vertices):
+                low = np.minimum(low, vertices.min(axis=0))
+                high = np.maximum(high, vertices.max(axis=0))
+            n_vertices += len(vertices)
+            n_faces += len(faces)
+        spool.seek(0)
+        shutil.copyfileobj(spool, f, COPY_SIZE)
+
+        positions = 12 * n_vertices
+        indices = 12 * n_faces
+        gltf = {
+            "asset": {"version": "2.0", "generator": "Proyecto-Mallas-Geometricas"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [{"mesh": 0}],
+            "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+            "buffers": [{"byteLength": positions + indices}],
+            "bufferViews": [
+                {"buffer": 0, "byteOffset": 0, "byteLength": positions, "target": 34962},
+                {"buffer": 0, "byteOffset": positions, "byteLength": indices, "target": 34963},
+            ],
+            "accessors": [
+                {"bufferView": 0, "componentType": 5126, "count": n_vertices, "type": "VEC3",
+                 "min": low.tolist() if n_vertices else [0, 0, 0],
+                 "max": high.tolist() if n_vertices else [0, 0, 0]},
+                {"bufferView": 1, "componentType": 5125, "count": 3 * n_faces, "type": "SCALAR"},
+            ],
+        }
+        text = json.dumps(gltf, separators=(",", ":")).encode("ascii")
+        if len(text) > GLB_JSON_SIZE:
+            raise ValueError("El encabezado glTF no cabe en el espacio reservado")
+
+        # positions e indices son multiplos de 4, asi que el chunk BIN ya esta alineado
+        f.seek(0)
+        f.write(struct.pack("<4sII", b"glTF", 2, start + positions + indices))
+        f.write(struct.pack("<I4s", GLB_JSON_SIZE, b"JSON") + text.ljust(GLB_JSON_SIZE))
+        f.write(struct.pack("<I4s", positions + indices, b"BIN\0"))
+    return n_vertices, n_faces
+
+WRITERS = {".ply": stream_ply, ".stl": stream_stl, ".glb": stream_glb}
+
+def stream_mesh(path, chunks):
+    """
+    Escribe una malla por partes en el formato que indica la extension de
+    `path` (.ply, .stl o .glb).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Formato de exportacion no soportado: {path}")
+    return WRITERS[extension](path, chunks)
+
+def write_mesh(path, vertices, faces):
+    """
+    Escribe una malla completa (ver stream_mesh).
+    :param vertices: Arreglo (k, 3).
+    :param faces: Arreglo (m, 3) o caras en formato PyVista.
+    """
+    return stream_mesh(path, [(vertices, faces)])
+
+FRACTALS = {"sierpinsky": fractals.sierpinsky_chunks, "tetrahedron": fractals.tetrahedron_chunks}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta un fractal a PLY, STL o glTF binario.")
+    parser.add_argument("output", help="Archivo de salida (.ply, .stl o .glb)")
+    parser.add_argument("--fractal", choices=sorted(FRACTALS), default="sierpinsky")
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--chunk-size", type=int, default=2**16,
+                        help="Tetraedros generados y escritos a la vez")
+    args = parser.parse_args(argv)
+
+    stream_mesh(args.output, FRACTALS[args.fractal](args.level, args.chunk_size))
+    print(f"{args.output}: {args.fractal} nivel {args.level}, {4**args.level} tetraedros")
+
+if __name__ == "__main__":
+    main()
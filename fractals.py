@@ -1,126 +1,224 @@
 import numpy as np
+import profiling
 
-def generate_sierpinsky3D(n=0):
+# Caras de un tetraedro, como índices de sus cuatro vértices
+TETRAHEDRON_FACES = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]], dtype=np.uint32)
+
+# Vértices del tetraedro inicial de ambos fractales
+BASE_TETRAHEDRON = np.array([
+    [0.0, 0.0, 0.0],  # Vértice inferior
+    [1.0, 0.0, 0.0],  # Vértice derecho
+    [0.5, np.sqrt(3) / 2, 0.0],  # Vértice izquierdo
+    [0.5, np.sqrt(3) / 6, np.sqrt(2) / np.sqrt(3)],  # Vértice superior
+])
+
+def tetrahedron_indices(m):
+    """
+    Índices de los triángulos de m tetraedros con 4 vértices propios cada uno,
+    guardados uno tras otro.
+    :param m: Número de tetraedros.
+    :return: Arreglo (4m, 3) de índices uint32.
+    """
+    starts = np.arange(m, dtype=np.uint32) * 4
+    return (starts[:, None, None] + TETRAHEDRON_FACES).reshape(-1, 3)
+
+def tetrahedra_weights(n, step):
+    """
+    Repite la subdivisión de un fractal sobre pesos enteros en lugar de
+    posiciones: cada vértice se representa como combinación de los cuatro
+    vértices del tetraedro inicial, con pesos enteros escalados por 2^n. Así
+    los vértices compartidos son exactamente iguales sin importar por qué
+    camino se calcularon.
+    :param n: Nivel de iteración del fractal.
+    :param step: Función que recibe los pesos (m, 4, 4) de un nivel y
+                 devuelve los de sus hijos, sin dividir por 2.
+    :return: Pesos (4^n, 4, 4) de todos los tetraedros.
+    """
+    weights = np.eye(4, dtype=np.int64)[None]
+    for _ in range(n):
+        weights = step(weights).reshape(-1, 4, 4)
+    return weights
+
+def subdivide_instances(instances, step):
+    """
+    Un paso de la subdivisión sobre instancias: reemplaza cada tetraedro por
+    sus cuatro hijos, que quedan seguidos. Como cada tetraedro es una copia de
+    BASE_TETRAHEDRON, basta guardar su desplazamiento o y su escala s (sus
+    vértices son o + s * v).
+    :param instances: Arreglo (m, 4) con filas (x, y, z, escala).
+    :param step: Función que recibe los desplazamientos (m, 3) y escalas (m,)
+                 y devuelve los desplazamientos (m, 4, 3) de los hijos (la
+                 escala de los hijos siempre es s / 2).
+    :return: Arreglo (4m, 4) float32 con las instancias de los hijos.
+    """
+    offsets, scales = instances[:, :3], instances[:, 3]
+    children = np.empty((len(instances), 4, 4), dtype=np.float32)
+    children[:, :, :3] = step(offsets, scales)
+    children[:, :, 3] = scales[:, None] / 2
+    return children.reshape(-1, 4)
+
+@profiling.timed("fractals.tetrahedra_instances")
+def tetrahedra_instances(n, step):
+    """
+    Repite la subdivisión de un fractal sobre instancias en lugar de vértices
+    (ver subdivide_instances).
+    :param n: Nivel de iteración del fractal.
+    :param step: Regla de los hijos, como sierpinsky_step.
+    :return: Arreglo (4^n, 4) float32 con filas (x, y, z, escala), en el mismo
+             orden que los tetraedros de la versión sin instancias.
+    """
+    instances = np.array([[0.0, 0.0, 0.0, 1.0]], dtype=np.float32)
+    for _ in range(n):
+        instances = subdivide_instances(instances, step)
+    return instances
+
+def sierpinsky_step(offsets, scales):
+    # (v_k + v_j) / 2 con v = o + s * b: el hijo k queda en o + s/2 * b_k
+    return offsets[:, None, :] + (scales / 2)[:, None, None] * BASE_TETRAHEDRON
+
+def tetrahedron_step(offsets, scales):
+    # 0.5 v_j + v_k con v = o + s * b: el hijo k queda en 1.5 o + s * b_k
+    return 1.5 * offsets[:, None, :] + scales[:, None, None] * BASE_TETRAHEDRON
+
+def sierpinsky_instances(n=0):
+    """
+    Instancias del fractal de generate_sierpinsky3D, para dibujarlo con un solo
+    tetraedro base (ver tetrahedra_instances).
+    :param n: Nivel de iteración del fractal.
+    :return: Arreglo (4^n, 4) float32 de instancias (x, y, z, escala).
+    """
+    return tetrahedra_instances(n, sierpinsky_step)
+
+def tetrahedron_instances(n=0):
+    """
+    Instancias del fractal de generate_tetrahedron (ver tetrahedra_instances).
+    :param n: Nivel de iteración del fractal.
+    :return: Arreglo (4^n, 4) float32 de instancias (x, y, z, escala).
+    """
+    return tetrahedra_instances(n, tetrahedron_step)
+
+def sierpinsky_subdivide(tetrahedra):
+    # Hijos de generate_sierpinsky3D: tetras[:, k, j] = (v_k + v_j) / 2
+    return ((tetrahedra[:, :, None, :] + tetrahedra[:, None, :, :]) / 2).reshape(-1, 4, 3)
+
+def tetrahedron_subdivide(tetrahedra):
+    # Hijos de generate_tetrahedron: tetras[:, k, j] = 0.5 * v_j + v_k
+    return (0.5 * tetrahedra[:, None, :, :] + tetrahedra[:, :, None, :]).reshape(-1, 4, 3)
+
+def tetrahedra_chunks(n, subdivide, chunk_size=2**16):
+    """
+    Genera los tetraedros de un nivel por partes, para niveles demasiado
+    grandes para tenerlos completos en memoria: se subdivide hasta un nivel
+    intermedio y luego cada grupo de tetraedros se subdivide por separado
+    hasta el nivel n. Como la subdivisión de cada tetraedro no depende de los
+    demás, las partes seguidas dan los mismos vértices, en el mismo orden, que
+    la versión completa.
+    :param n: Nivel de iteración del fractal.
+    :param subdivide: Regla de los hijos, como sierpinsky_subdivide.
+    :param chunk_size: Tetraedros por parte (aproximado si no es potencia de 4).
+    :return: Iterador de (vértices (4c, 3) float32, índices (4c, 3) uint32),
+             con los índices relativos a los vértices de cada parte.
+    """
+    # Niveles que se subdividen dentro de cada parte
+    inner = 0
+    while inner < n and 4 ** (inner + 1) <= chunk_size:
+        inner += 1
+    tetrahedra = BASE_TETRAHEDRON[None]
+    for _ in range(n - inner):
+        tetrahedra = subdivide(tetrahedra)
+
+    roots = max(1, chunk_size // 4**inner)
+    for start in range(0, len(tetrahedra), roots):
+        chunk = tetrahedra[start:start + roots]
+        for _ in range(inner):
+            chunk = subdivide(chunk)
+        yield chunk.reshape(-1, 3).astype(np.float32), tetrahedron_indices(len(chunk))
+
+def sierpinsky_chunks(n=0, chunk_size=2**16):
+    """
+    Vértices e índices de generate_sierpinsky3D por partes (ver tetrahedra_chunks).
+    """
+    return tetrahedra_chunks(n, sierpinsky_subdivide, chunk_size)
+
+def tetrahedron_chunks(n=0, chunk_size=2**16):
+    """
+    Vértices e índices de generate_tetrahedron por partes (ver tetrahedra_chunks).
+    """
+    return tetrahedra_chunks(n, tetrahedron_subdivide, chunk_size)
+
+@profiling.timed("fractals.weld_vertices")
+def weld_vertices(weights, base_vertices, scale):
+    """
+    Malla con vértices compartidos a partir de los pesos de tetrahedra_weights:
+    los vértices repetidos se unen con np.unique y los índices se reasignan.
+    :param weights: Pesos enteros (m, 4, 4) de los tetraedros.
+    :param base_vertices: Vértices (4, 3) del tetraedro inicial.
+    :param scale: Factor por el que están escalados los pesos.
+    :return: (vértices únicos float32, índices (4m, 3)); los índices son uint16
+             si hay a lo más 65536 vértices y uint32 si no.
+    """
+    flat = weights.reshape(-1, 4)
+    radix = int(flat.max()) + 1
+    if radix**4 < 2**63:
+        # Empaquetar los cuatro pesos en una sola clave entera, más rápido de ordenar
+        keys = flat @ (radix ** np.arange(3, -1, -1, dtype=np.int64))
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(flat, axis=0, return_index=True, return_inverse=True)
+
+    vertices = (flat[first] @ np.asarray(base_vertices)) / scale
+    index_type = np.uint16 if len(first) <= 2**16 else np.uint32
+    remap = inverse.reshape(-1).astype(index_type)
+    return vertices.astype(np.float32), remap[tetrahedron_indices(len(weights))]
+
+@profiling.timed("fractals.generate_sierpinsky3D")
+def generate_sierpinsky3D(n=0, weld=False):
     """
     Genera los vértices e índices de un fractal tetraédrico.
     :param n: Nivel de iteración del fractal.
+    :param weld: Si es True, los tetraedros vecinos comparten sus vértices en
+                 lugar de tener 4 propios cada uno (ver weld_vertices).
     :return: (vértices, índices) del fractal generado.
     """
-    # Define los vértices del tetraedro inicial
-    v0 = np.array([0.0, 0.0, 0.0])  # Vértice inferior
-    v1 = np.array([1.0, 0.0, 0.0])  # Vértice derecho
-    v2 = np.array([0.5, np.sqrt(3) / 2, 0.0])  # Vértice izquierdo
-    v3 = np.array([0.5, np.sqrt(3) / 6, np.sqrt(2) / np.sqrt(3)])  # Vértice superior
-
-    base_tetrahedron = [v0, v1, v2, v3]
-
-    # Función recursiva para subdividir el tetraedro
-    def subdivide(vertices, level):
-        if level == 0:
-            return [vertices]
-        
-        # Calcula los puntos medios de las aristas
-        mid01 = (vertices[0] + vertices[1]) / 2
-        mid02 = (vertices[0] + vertices[2]) / 2
-        mid03 = (vertices[0] + vertices[3]) / 2
-        mid12 = (vertices[1] + vertices[2]) / 2
-        mid13 = (vertices[1] + vertices[3]) / 2
-        mid23 = (vertices[2] + vertices[3]) / 2
-
-        # Subtetraedros (en las esquinas)
-        t1 = [vertices[0], mid01, mid02, mid03]
-        t2 = [mid01, vertices[1], mid12, mid13]
-        t3 = [mid02, mid12, vertices[2], mid23]
-        t4 = [mid03, mid13, mid23, vertices[3]]
-
-        # Subdivide cada subtetraedro
-        return (
-            subdivide(t1, level - 1)
-            + subdivide(t2, level - 1)
-            + subdivide(t3, level - 1)
-            + subdivide(t4, level - 1)
-        )
-
-    # Genera el fractal recursivamente
-    tetrahedra = subdivide(base_tetrahedron, n)
-
-    # Aplanar los datos de los vértices e índices
-    vertices = []
-    indices = []
-    for i, tetra in enumerate(tetrahedra):
-        start_index = len(vertices)
-        vertices.extend(tetra)
-        indices.extend(
-            [
-                [start_index, start_index + 1, start_index + 2],
-                [start_index, start_index + 1, start_index + 3],
-                [start_index, start_index + 2, start_index + 3],
-                [start_index + 1, start_index + 2, start_index + 3],
-            ]
-        )
-
-    return np.array(vertices, dtype=np.float32), np.array(indices, dtype=np.uint32)
+    if weld:
+        # Misma subdivisión sobre pesos enteros: v_k + v_j en vez de (v_k + v_j) / 2
+        weights = tetrahedra_weights(n, lambda w: w[:, :, None, :] + w[:, None, :, :])
+        return weld_vertices(weights, BASE_TETRAHEDRON, 2**n)
+
+    # Todos los tetraedros de un nivel se guardan en un arreglo (m, 4, 3) y se
+    # subdividen juntos. El subtetraedro k de cada tetraedro tiene como
+    # vértices los puntos medios entre su vértice k y cada uno de los otros
+    # (el punto medio de un vértice consigo mismo es el mismo vértice):
+    # tetras[:, k, j] = (v_k + v_j) / 2. Los hijos de cada tetraedro quedan
+    # seguidos, en el mismo orden que la versión recursiva.
+    tetrahedra = BASE_TETRAHEDRON[None]
+    for _ in range(n):
+        tetrahedra = sierpinsky_subdivide(tetrahedra)
+
+    return tetrahedra.reshape(-1, 3).astype(np.float32), tetrahedron_indices(len(tetrahedra))
 
 import numpy as np
 
 import numpy as np
 
-def generate_tetrahedron(n=0):
+@profiling.timed("fractals.generate_tetrahedron")
+def generate_tetrahedron(n=0, weld=False):
     """
     Genera un fractal tridimensional colocando tetraedros escalados dentro del original.
     :param n: Nivel de iteración del fractal.
+    :param weld: Si es True, los tetraedros vecinos comparten sus vértices en
+                 lugar de tener 4 propios cada uno (ver weld_vertices).
     :return: (vértices, índices) del fractal generado.
     """
-    # Define los vértices del tetraedro inicial
-    v0 = np.array([0.0, 0.0, 0.0])  # Vértice inferior
-    v1 = np.array([1.0, 0.0, 0.0])  # Vértice derecho
-    v2 = np.array([0.5, np.sqrt(3) / 2, 0.0])  # Vértice izquierdo
-    v3 = np.array([0.5, np.sqrt(3) / 6, np.sqrt(2) / np.sqrt(3)])  # Vértice superior
-
-    base_tetrahedron = [v0, v1, v2, v3]
-
-    # Función para escalar y trasladar un tetraedro
-    def transform_tetrahedron(vertices, scale, translation):
-        return [scale * vertex + translation for vertex in vertices]
-
-    # Función recursiva para construir el fractal
-    def subdivide(vertices, level):
-        if level == 0:
-            return [vertices]
-
-        # Escalar el tetraedro por 1/2
-        scale = 0.5
-
-        # Centros de los nuevos tetraedros
-        new_tetrahedra = [
-            transform_tetrahedron(vertices, scale, vertices[0]),  # Escalar y mover a v0
-            transform_tetrahedron(vertices, scale, vertices[1]),  # Escalar y mover a v1
-            transform_tetrahedron(vertices, scale, vertices[2]),  # Escalar y mover a v2
-            transform_tetrahedron(vertices, scale, vertices[3]),  # Escalar y mover a v3
-        ]
-
-        # Subdivide recursivamente
-        result = []
-        for tetra in new_tetrahedra:
-            result.extend(subdivide(tetra, level - 1))
-        return result
-
-    # Generar el fractal
-    tetrahedra = subdivide(base_tetrahedron, n)
-
-    # Aplanar los datos de vértices e índices
-    vertices = []
-    indices = []
-    for i, tetra in enumerate(tetrahedra):
-        start_index = len(vertices)
-        vertices.extend(tetra)
-        indices.extend(
-            [
-                [start_index, start_index + 1, start_index + 2],
-                [start_index, start_index + 1, start_index + 3],
-                [start_index, start_index + 2, start_index + 3],
-                [start_index + 1, start_index + 2, start_index + 3],
-            ]
-        )
-
-    return np.array(vertices, dtype=np.float32), np.array(indices, dtype=np.uint32)
+    if weld:
+        # Misma subdivisión sobre pesos enteros: v_j + 2 v_k en vez de 0.5 v_j + v_k
+        weights = tetrahedra_weights(n, lambda w: w[:, None, :, :] + 2 * w[:, :, None, :])
+        return weld_vertices(weights, BASE_TETRAHEDRON, 2**n)
+
+    # Cada tetraedro se escala por 1/2 y se traslada a cada uno de sus cuatro
+    # vértices: tetras[:, k, j] = 0.5 * v_j + v_k, para todos a la vez
+    tetrahedra = BASE_TETRAHEDRON[None]
+    for _ in range(n):
+        tetrahedra = tetrahedron_subdivide(tetrahedra)
+
+    return tetrahedra.reshape(-1, 3).astype(np.float32), tetrahedron_indices(len(tetrahedra))
@@ -0,0 +1,117 @@
+import json
+import struct
+import numpy as np
+
+# Formato binario compacto para mapas de alturas (.hf):
+#   "HFLD" | version (uint16) | largo del encabezado (uint32) | encabezado JSON
+#   | datos crudos (little-endian, fila por fila, alineados a 64 bytes)
+# El encabezado guarda la forma, el tipo, el rango de alturas y los parametros
+# con los que se genero el terreno (semilla, offsets, octavas...). Los datos se
+# abren con np.memmap, asi que leer una ventana no carga el archivo completo.
+
+MAGIC = b"HFLD"
+VERSION = 1
+_PREFIX = struct.Struct("<4sHI")
+_ALIGN = 64
+
+# Tipos de dato soportados; uint16 guarda las alturas cuantizadas en el rango
+# [z_min, z_max] del encabezado
+DTYPES = {"float32": "<f4", "float16": "<f2", "uint16": "<u2"}
+_QMAX = np.iinfo(np.uint16).max
+
+
+class Heightfield:
+    """
+    Mapa de alturas guardado en disco. Indexarlo devuelve alturas float32
+    (descuantizadas si corresponde) solo para la ventana pedida, y asignarle
+    valores los escribe en el archivo.
+    """
+
+    def __init__(self, data, header):
+        self.data = data      # np.memmap con los valores crudos
+        self.header = header  # Diccionario con los metadatos del archivo
+        self.shape = data.shape
+        self.quantized = header["dtype"] == "uint16"
+        self.z_min = header["z_min"]
+        self.z_max = header["z_max"]
+
+    def __getitem__(self, key):
+        values = self.data[key]
+        if self.quantized:
+            step = (self.z_max - self.z_min) / _QMAX
+            return (self.z_min + values * step).astype(np.float32)
+        return np.asarray(values, dtype=np.float32)
+
+    def __setitem__(self, key, heights):
+        if self.quantized:
+            heights = np.asarray(heights, dtype=np.float64)
+            span = (self.z_max - self.z_min) or 1.0
+            q = np.rint((heights - self.z_min) / span * _QMAX)
+            self.data[key] = np.clip(q, 0, _QMAX)
+        else:
+            self.data[key] = heights
+
+    def flush(self):
+        self.data.flush()
+
+
+def create_heightfield(path, shape, z_range, dtype="uint16", **meta):
+    """
+    Crea un archivo .hf vacio y lo abre para escritura, por ejemplo para
+    llenarlo bloque a bloque con terrain.terrain_tiles.
+    :param shape: Forma (filas, columnas) del mapa de alturas.
+    :param z_range: (min, max) de las alturas; define la cuantizacion uint16.
+    :param dtype: "float32", "float16" o "uint16".
+    :param meta: Metadatos extra para el encabezado (semilla, offsets, ...).
+    :return: Heightfield en modo escritura.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Tipo de dato no soportado: {dtype}")
+    header = dict(meta, dtype=dtype, shape=list(shape),
+                  z_min=float(z_range[0]), z_max=float(z_range[1]))
+    text = json.dumps(header).encode("utf-8")
+    # Rellenar con espacios para que los datos queden alineados
+    text += b" " * (-(_PREFIX.size + len(text)) % _ALIGN)
+
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(text)))
+        f.write(text)
+    offset = _PREFIX.size + len(text)
+    data = np.memmap(path, dtype=DTYPES[dtype], mode="r+", offset=offset, shape=tuple(shape))
+    return Heightfield(data, header)
+
+def save_heightfield(path, heights, dtype="uint16", **meta):
+    """
+    Guarda un mapa de alturas completo (puede ser un np.memmap), escribiendolo
+    por bandas de filas para no duplicarlo en memoria.
+    :param heights: Arreglo 2D de alturas.
+    :param dtype: "float32", "float16" o "uint16".
+    :param meta: Metadatos extra para el encabezado (semilla, offsets, ...).
+    :return: Heightfield escrito.
+    """
+    heights = np.asarray(heights)
+    hf = create_heightfield(path, heights.shape, (np.min(heights), np.max(heights)),
+                            dtype, **meta)
+    rows = max(1, 2**22 // max(1, heights.shape[1]))  # ~4M de valores por banda
+    for r in range(0, heights.shape[0], rows):
+        hf[r:r + rows] = heights[r:r + rows]
+    hf.flush()
+    return hf
+
+def load_heightfield(path, mode="r"):
+    """
+    Abre un archivo .hf sin leer los datos: se mapean en memoria y solo se
+    cargan las ventanas que se indexen.
+    :param mode: "r" para solo lectura, "r+" para modificarlo.
+    :return: Heightfield.
+    """
+    with open(path, "rb") as f:
+        magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un archivo de alturas .hf")
+        if version != VERSION:
+            raise ValueError(f"Version de archivo .hf no soportada: {version}")
+        header = json.loads(f.read(length))
+    data = np.memmap(path, dtype=DTYPES[header["dtype"]], mode=mode,
+                     offset=_PREFIX.size + length, shape=tuple(header["shape"]))
+    return Heightfield(data, header)
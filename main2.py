@@ -1,19 +1,25 @@
 import numpy as np
-from scipy.spatial import Delaunay
 import pyvista as pv
-from noise import pnoise2
+import perlin
+import profiling
+import resultcache
+import rtin
+import terrain
+from terrain import grid_points, grid_faces, scale_heights
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
-import random
+import math
 import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuracion de la semilla global para reproducibilidad
 seed = int(time.time())
-random.seed(seed)
 
 # Generar desplazamientos aleatorios entre 0 y 10,000
-offset_x = random.randint(0, 10000)
-offset_y = random.randint(0, 10000)
+offset_x, offset_y = terrain.offsets_from_seed(seed)
+print(f"Semilla: {seed}")
 print(f"Offsets generados: offset_x={offset_x}, offset_y={offset_y}")
 
 # Crear un mapa de colores personalizado
@@ -49,46 +55,20 @@ terrain_cmap = LinearSegmentedColormap.from_list(
 # cada especificada y las suma (interpolacion)
 # Ademas se modifica la amplitud y la frecuencia de cada octava
 # de acuerdo a la persistencia y la lacunarity (gap)
-def fbm(x, y, octaves, persistence, lacunarity):
-    total = 0
-    frequency = 1
-    amplitude = 1
-    max_value = 0 
-    for i in range(octaves):
-        total += pnoise2(x * frequency + offset_x,
-                         y * frequency + offset_y,
-                         repeatx=1024, repeaty=1024) * amplitude
-        max_value += amplitude
-        amplitude *= persistence
-        frequency *= lacunarity
-
-    return total / max_value
-
-def mountain_terrain(x, y, octaves, persistence, lacunarity):
-    return 2 * fbm(x*6, y*3, octaves, persistence, lacunarity)
-
-def plains_terrain(x, y, octaves, persistence, lacunarity):
-    return ((fbm(x, y, octaves, persistence, lacunarity))**(0.25)) - 0.6
-
-def simple_curve(x, y):
-    """
-    Define un peso basado en la distancia radial al origen.
-    La planicie se encuentra cerca del centro (distancia baja).
-    """
-    val = (x**2 + y**2)**0.5  # Distancia radial al origen
-    start = 0.3  # Radio interno de la planicie
-    end = 0.7    # Radio externo donde empiezan las montañas
-    if val < start:
-        return 1  # Planicie completa
-    elif val > end:
-        return 0  # Montañas completas
-    return (end - val) / (end - start)  # Transicion suave
-
-def combined_terrain(x, y, octaves, persistence, lacunarity):
-    m = mountain_terrain(x, y, octaves, persistence, lacunarity)
-    p = plains_terrain(x, y, octaves, persistence, lacunarity)
-    w = simple_curve(x, y)
-    return (1-w)*m + w*p
+# Trabaja sobre arreglos completos de coordenadas (ver perlin.fbm).
+# Si se indica `domain` (resolucion + transformacion de las coordenadas) las
+# octavas se guardan en octave_cache y se reutilizan entre llamadas
+octave_cache = perlin.OctaveCache()
+
+def fbm(x, y, octaves, persistence, lacunarity, domain=None):
+    cache = octave_cache if domain is not None else None
+    return perlin.fbm(x, y, octaves, persistence, lacunarity, offset_x, offset_y,
+                      cache=cache, key=domain)
+
+# Terreno con los desplazamientos de esta sesion (ver terrain.combined_terrain)
+def combined_terrain(x, y, octaves, persistence, lacunarity, domain=None):
+    return terrain.combined_terrain(x, y, octaves, persistence, lacunarity,
+                                    (offset_x, offset_y), octave_cache, domain)
 
 def combined_noise(x, y, octaves, persistence, lacunarity):
     # Parametros para el movimiento browniano fractal
@@ -97,7 +77,7 @@ def combined_noise(x, y, octaves, persistence, lacunarity):
 
 def toggle_widgets(value):  # Recibe el estado del boton
     if value:  # Mostrar sliders y barra
-        create_sliders(plotter, update_mesh)  # Agregar sliders nuevamente
+        create_sliders(plotter, update_mesh, terrain_worker.finish)  # Agregar sliders nuevamente
         plotter.remove_scalar_bar()  # Asegurarse de que no haya duplicados
         # Volver a asignar la barra de colores al actor
         plotter.add_scalar_bar(
@@ -112,37 +92,268 @@ def toggle_widgets(value):  # Recibe el estado del boton
 
 # Generar malla base
 n = 200
-x = np.linspace(-1, 1, n)
-y = np.linspace(-1, 1, n)
-xx, yy = np.meshgrid(x, y)
-points = np.c_[xx.ravel(), yy.ravel()]
-tri = Delaunay(points)
-faces_pyvista = np.hstack([[3] + list(face) for face in tri.simplices])
-
-# Limites para la altura z
-z_min_target = -0.05  # Profundidad maxima (mar)
-z_max_target = 0.2   # Altura maxima (montañas)
+points = grid_points(n)
+faces_pyvista = grid_faces(n)
+
+# Cache en disco de las alturas completas (ver resultcache.py): al repetir
+# parametros, en esta sesion o en otra, no se vuelven a calcular
+result_cache = resultcache.ResultCache()
+terrain_version = resultcache.code_version(perlin, terrain)
+
+def terrain_cache_key(octaves, persistence, lacunarity):
+    return result_cache.key("terrain_heights", terrain_version,
+                            **terrain.terrain_cache_params(n, octaves, persistence, lacunarity,
+                                                           (offset_x, offset_y)))
+
+# Calcular las alturas del terreno ya escaladas al rango [z_min_target, z_max_target]
+def terrain_heights(octaves, persistence, lacunarity):
+    key = terrain_cache_key(octaves, persistence, lacunarity)
+    z = result_cache.get(key)
+    if z is None:
+        z = terrain.terrain_heights(n, octaves, persistence, lacunarity,
+                                    (offset_x, offset_y), octave_cache)
+        result_cache.put(key, z)
+    return z
 
 # Crear una funcion para generar elcombined_noise terreno
+@profiling.timed("main2.generate_terrain")
 def generate_terrain(octaves, persistence, lacunarity):
-    z = np.array([combined_terrain(p[0], p[1], octaves, persistence, lacunarity) for p in points])
-
-    # Calcular los valores minimo y maximo originales de z
-    z_min_original = np.min(z)
-    z_max_original = np.max(z)
-    
-    # Normalizar z entre 0 y 1
-    z_normalized = (z - z_min_original) / (z_max_original - z_min_original)
-    
-    # Escalar z al rango deseado
-    z_scaled = z_min_target + z_normalized * (z_max_target - z_min_target)
-    z_scaled = z_scaled 
-    
-    points_3d = np.c_[points, z_scaled]
-    mesh = pv.PolyData(points_3d, faces_pyvista)
-    mesh["height"] = z_scaled  # Asignar alturas como escalares
+    z_scaled = terrain_heights(octaves, persistence, lacunarity)
+
+    with profiling.timer("main2.polydata"):
+        points_3d = np.c_[points, z_scaled]
+        mesh = pv.PolyData(points_3d, faces_pyvista)
+        mesh["height"] = z_scaled  # Asignar alturas como escalares
     return mesh
 
+# Refinamiento progresivo: mientras se mueven los sliders se muestra primero
+# una version gruesa del terreno y luego se refina hasta la resolucion completa
+progressive = True
+# Puntos por lado del nivel mas grueso: su paso crece con n para que su costo
+# (y la latencia mientras se arrastra un slider) no dependa de la resolucion
+coarse_points = 32
+
+def progressive_strides(n, coarse_points):
+    """
+    Pasos de los niveles de detalle, de mayor a menor: potencias de 2 desde
+    la menor cuyo nivel tiene a lo mas coarse_points puntos por lado (y al
+    menos 8) hasta 1.
+    """
+    stride = 8
+    while len(lod_indices(n, stride)) > coarse_points:
+        stride *= 2
+    return tuple(stride >> k for k in range(stride.bit_length()))
+
+
+def lod_indices(n, stride):
+    """
+    Indices, en cada eje, de los puntos de la grilla n x n que forman el nivel
+    de detalle con paso `stride`. Los niveles son subconjuntos de la grilla
+    completa, asi que cada nivel contiene a los mas gruesos; el ultimo indice
+    se incluye siempre para cubrir todo [-1, 1].
+    """
+    return np.unique(np.r_[np.arange(0, n, stride), n - 1])
+
+lod_strides = progressive_strides(n, coarse_points)  # Paso (en puntos de la grilla) de cada nivel
+
+def progressive_heights(octaves, persistence, lacunarity, strides=lod_strides):
+    """
+    Genera las alturas del terreno de lo grueso a lo fino. Cada nivel solo
+    evalua los puntos que no estaban en los niveles anteriores.
+    :param strides: Pasos de los niveles de detalle, de mayor a menor.
+    :return: Generador de (paso, alturas escaladas del nivel, fila por fila).
+    """
+    axis = np.linspace(-1, 1, n)
+    z = np.empty((n, n))
+    known = np.zeros((n, n), dtype=bool)
+    prev = None
+    for stride in strides:
+        idx = lod_indices(n, stride)
+        level = np.ix_(idx, idx)
+        rows, cols = np.nonzero(~known[level])
+        rows, cols = idx[rows], idx[cols]
+        # Los puntos nuevos de cada nivel son siempre los mismos para un n
+        # dado, asi que (n, paso, paso anterior) identifica su dominio en la cache
+        with profiling.timer(f"main2.progressive_level[{stride}]"):
+            z[rows, cols] = combined_terrain(axis[cols], axis[rows], octaves, persistence,
+                                             lacunarity, domain=(n, stride, prev))
+            known[rows, cols] = True
+            prev = stride
+            z_level = scale_heights(z[level].ravel())
+        yield stride, z_level
+
+# Simplificacion adaptativa (ver rtin.py): error vertical maximo de la malla
+# final; las planicies quedan con muchos menos triangulos que las montañas.
+# Las alturas se evaluan sobre la mayor grilla 2^k + 1 que no supera n (129
+# puntos por lado para n = 200), para que la malla nunca sea mas densa que la
+# grilla uniforme; a cambio, el detalle mas fino que puede mostrar es algo
+# menor. Con None se usa la grilla uniforme de n x n
+adaptive_error = None
+
+@profiling.timed("main2.adaptive_terrain")
+def adaptive_terrain(octaves, persistence, lacunarity, max_error):
+    """
+    Malla simplificada del terreno. RTIN necesita grillas de 2^k + 1 puntos por
+    lado, asi que las alturas se evaluan sobre la mayor de ellas que no supera n.
+    :return: (puntos (k, 3), caras en formato PyVista).
+    """
+    size = rtin.rtin_size(n, round_up=False)
+    z = terrain.terrain_heights(size, octaves, persistence, lacunarity,
+                                (offset_x, offset_y), octave_cache)
+    return rtin.rtin_mesh(z.reshape(size, size), max_error)
+
+def terrain_levels(octaves, persistence, lacunarity):
+    """
+    Resultados que calcula el hilo de trabajo para unos parametros: los
+    niveles de detalle de progressive_heights y, si adaptive_error no es None,
+    la malla adaptativa en lugar de la grilla completa.
+    :return: Generador de (paso, alturas) o ("adaptive", (puntos, caras)).
+    """
+    strides = lod_strides if progressive else (1,)
+    key = terrain_cache_key(octaves, persistence, lacunarity)
+    if adaptive_error is not None:
+        strides = tuple(s for s in strides if s != 1)
+    else:
+        # Si el terreno completo ya esta en disco no hace falta refinar
+        z = result_cache.get(key)
+        if z is not None:
+            yield 1, z
+            return
+    for stride, z in progressive_heights(octaves, persistence, lacunarity, strides=strides):
+        if stride == 1:
+            result_cache.put(key, z)
+        yield stride, z
+    if adaptive_error is not None:
+        yield "adaptive", adaptive_terrain(octaves, persistence, lacunarity, adaptive_error)
+
+def grid_normals(z, axis):
+    """
+    Normales por vertice de una grilla cuadrada a partir de las diferencias
+    finitas de z, sin reconstruir la malla.
+    :param z: Alturas (m*m,) ordenadas fila por fila.
+    :param axis: Coordenadas (m,) de la grilla en cada eje.
+    :return: Arreglo (m*m, 3) de normales unitarias apuntando hacia +z.
+    """
+    m = len(axis)
+    dz_dy, dz_dx = np.gradient(z.reshape(m, m), axis, axis)
+    normals = np.empty((m * m, 3))
+    normals[:, 0] = -dz_dx.ravel()
+    normals[:, 1] = -dz_dy.ravel()
+    normals[:, 2] = 1
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    return normals
+
+@profiling.timed("main2.update_heights")
+def update_heights(mesh, z):
+    """
+    Sobrescribe en el lugar las alturas de una malla del terreno: la columna z
+    de los puntos, el escalar "height" y, si existen, las normales. La
+    topologia no cambia entre actualizaciones, asi que las caras no se tocan.
+    :param mesh: Malla sobre una grilla cuadrada ordenada fila por fila
+                 (por ejemplo la del actor o la de un nivel de detalle).
+    :param z: Nuevas alturas (una por punto).
+    """
+    mesh.points[:, 2] = z
+    mesh["height"][:] = z
+    if "Normals" in mesh.point_data:
+        m = math.isqrt(mesh.n_points)
+        mesh.point_data["Normals"][:] = grid_normals(z, mesh.points[:m, 0])
+    mesh.Modified()
+
+class TerrainWorker:
+    """
+    Calcula el terreno en un hilo aparte para no bloquear la ventana.
+    Solo interesa el pedido mas reciente: los pedidos que llegan mientras hay
+    un calculo en curso se reemplazan entre si, y el resultado de un calculo
+    que quedo obsoleto se descarta. El calculo puede entregar varios
+    resultados cada vez mas finos; antes de pasar al siguiente se espera a que
+    los pedidos dejen de llegar, y si llega uno nuevo se abandona el
+    refinamiento. Los resultados se recogen con poll() desde el hilo
+    principal, que es el unico que puede tocar la escena de VTK.
+    (Un solo hilo de trabajo: NumPy libera el GIL durante el calculo y la
+    cache de octavas no necesita sincronizacion.)
+    """
+
+    def __init__(self, compute, settle=0.15):
+        """
+        :param compute: Funcion que recibe los parametros de submit() y
+                        devuelve un iterable con los resultados a aplicar.
+        :param settle: Segundos sin pedidos nuevos antes de refinar.
+        """
+        self._compute = compute
+        self.settle = settle
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._latest = 0       # Id del pedido mas reciente
+        self._last_submit = 0  # Momento (time.monotonic) del ultimo pedido
+        self._pending = None   # (id, parametros) a la espera del hilo
+        self._running = False
+        self._result = None    # Resultado del pedido mas reciente, sin aplicar
+
+    def submit(self, *args):
+        with self._lock:
+            self._latest += 1
+            self._last_submit = time.monotonic()
+            self._pending = (self._latest, args)
+            self._changed.notify_all()
+            if not self._running:
+                self._start_next()
+
+    def _start_next(self):
+        # Se llama con el lock tomado
+        job_id, args = self._pending
+        self._pending = None
+        self._running = True
+        self._executor.submit(self._run, job_id, args)
+
+    def _run(self, job_id, args):
+        try:
+            for result in self._compute(*args):
+                with self._lock:
+                    if job_id != self._latest:
+                        break
+                    self._result = result
+                    if not self._wait_settled(job_id):
+                        break
+        except Exception:
+            traceback.print_exc()
+        with self._lock:
+            self._running = False
+            if self._pending is not None:
+                self._start_next()
+
+    def finish(self):
+        """
+        Indica que por ahora no llegaran mas pedidos (se solto el slider): el
+        pedido mas reciente se refina sin esperar `settle`.
+        """
+        with self._lock:
+            self._last_submit = -math.inf
+            self._changed.notify_all()
+
+    def _wait_settled(self, job_id):
+        # Se llama con el lock tomado. Devuelve False si el pedido quedo obsoleto
+        while job_id == self._latest:
+            remaining = self._last_submit + self.settle - time.monotonic()
+            if remaining <= 0:
+                return True
+            self._changed.wait(remaining)
+        return False
+
+    def poll(self):
+        """
+        Devuelve el resultado listo para aplicar, o None si no hay uno nuevo.
+        """
+        with self._lock:
+            result, self._result = self._result, None
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            self._pending = None
+        self._executor.shutdown(wait=False)
+
 # Crear un renderizador interactivo
 plotter = pv.Plotter()
 plotter.show_axes()
@@ -152,12 +363,19 @@ octaves = 4
 persistence = 0.4
 lacunarity = 3
 mesh = generate_terrain(octaves, persistence, lacunarity)
+submitted = (octaves, persistence, lacunarity)  # Ultimos parametros pedidos al hilo de trabajo
 
 plotter.add_checkbox_button_widget(toggle_widgets, value=False, size=30)
 
-def create_sliders(plotter, update_callback):
+def create_sliders(plotter, update_callback, release_callback=None):
+    """
+    Crea los sliders de octavas, persistencia y lacunarity. update_callback se
+    llama en cada movimiento (para mostrar la vista previa mientras se
+    arrastra) y release_callback, si se indica, al soltar cada slider.
+    """
+    sliders = []
     # Slider para Octaves
-    plotter.add_slider_widget(
+    sliders.append(plotter.add_slider_widget(
         callback=lambda value: update_callback(value, "octaves"),
         rng=[1, 12],  # Rango de octavas
         value=4,      # Valor inicial
@@ -170,10 +388,11 @@ def create_sliders(plotter, update_callback):
         title_opacity=0.2,   # Opacidad del texto
         color="white",       # Color del fondo
         title_color="white", # Color del texto
-    )
+        interaction_event="always",  # Llamar mientras se arrastra, no solo al soltar
+    ))
 
     # Slider para Persistence
-    plotter.add_slider_widget(
+    sliders.append(plotter.add_slider_widget(
         callback=lambda value: update_callback(value, "persistence"),
         rng=[0.3, 0.7],  # Rango de persistence
         value=0.4,       # Valor inicial
@@ -186,10 +405,11 @@ def create_sliders(plotter, update_callback):
         title_opacity=0.2,   # Opacidad del texto
         color="white",       # Color del fondo
         title_color="white", # Color del texto
-    )
+        interaction_event="always",  # Llamar mientras se arrastra, no solo al soltar
+    ))
 
     # Slider para Lacunarity
-    plotter.add_slider_widget(
+    sliders.append(plotter.add_slider_widget(
         callback=lambda value: update_callback(value, "lacunarity"),
         rng=[1.5, 3.5],  # Rango de lacunarity
         value=3.0,       # Valor inicial
@@ -202,7 +422,12 @@ def create_sliders(plotter, update_callback):
         title_opacity=0.2,   # Opacidad del texto
         color="white",       # Color del fondo
         title_color="white", # Color del texto
-    )
+        interaction_event="always",  # Llamar mientras se arrastra, no solo al soltar
+    ))
+
+    if release_callback is not None:
+        for slider in sliders:
+            slider.AddObserver("EndInteractionEvent", lambda *args: release_callback())
 
 
 
@@ -215,6 +440,12 @@ actor = plotter.add_mesh(
     smooth_shading=True,
     show_scalar_bar=False,  # Deshabilitar barra de color automatica
 )
+# Malla que realmente dibuja el actor (con smooth_shading es una copia con normales);
+# las actualizaciones escriben directamente sobre ella
+render_mesh = actor.mapper.dataset
+# Reemplazar las normales que calculo VTK por las de grid_normals, para que el
+# sombreado del primer cuadro sea igual al de las actualizaciones
+update_heights(render_mesh, np.array(render_mesh["height"]))
 
 # Agregar una barra de colores personalizada
 plotter.add_scalar_bar(
@@ -225,8 +456,9 @@ plotter.add_scalar_bar(
 )
 
 # Funcion de actualizacion dinamica
+@profiling.timed("main2.update_mesh")
 def update_mesh(value, parameter):
-    global octaves, persistence, lacunarity
+    global octaves, persistence, lacunarity, submitted
     # Actualizar el parametro correspondiente
     if parameter == "octaves":
         octaves = int(value)
@@ -234,26 +466,73 @@ def update_mesh(value, parameter):
         persistence = value
     elif parameter == "lacunarity":
         lacunarity = value
-    # Regenerar la malla
-    new_mesh = generate_terrain(octaves, persistence, lacunarity)
-    actor.mapper.SetInputData(new_mesh)  # Actualizar el mapper del actor
-    plotter.remove_scalar_bar()  # Eliminar la barra existente
-    plotter.add_scalar_bar(
-        color="white",  # Texto blanco
-        title_font_size=12,
-        label_font_size=10,
-        outline=False,
-    )
-    plotter.render()  # Renderizar la escena actualizada
+    # Pedir las nuevas alturas al hilo de trabajo; apply_terrain las aplica.
+    # Al arrastrar llegan muchos eventos con el mismo valor (sobre todo en las
+    # octavas, que se redondean), y repetir el pedido reiniciaria el calculo
+    if (octaves, persistence, lacunarity) != submitted:
+        submitted = (octaves, persistence, lacunarity)
+        terrain_worker.submit(octaves, persistence, lacunarity)
+
+# Mallas de cada nivel de detalle, creadas la primera vez que se usan; el
+# nivel completo es la malla original del actor
+lod_meshes = {1: render_mesh}
+
+def lod_mesh(stride):
+    if stride not in lod_meshes:
+        axis = np.linspace(-1, 1, n)[lod_indices(n, stride)]
+        m = len(axis)
+        xx, yy = np.meshgrid(axis, axis)
+        mesh = pv.PolyData(np.c_[xx.ravel(), yy.ravel(), np.zeros(m * m)], grid_faces(m))
+        mesh["height"] = np.zeros(m * m)
+        mesh.point_data.active_normals = np.zeros((m * m, 3))
+        lod_meshes[stride] = mesh
+    return lod_meshes[stride]
+
+@profiling.timed("main2.adaptive_mesh")
+def adaptive_mesh(points, faces):
+    # La topologia de la malla adaptativa cambia con cada terreno, asi que se
+    # crea una malla nueva (con normales para el sombreado suave)
+    mesh = pv.PolyData(points, faces)
+    mesh["height"] = points[:, 2]
+    mesh.compute_normals(cell_normals=False, consistent_normals=False, inplace=True)
+    return mesh
+
+# Aplicar en el hilo principal las alturas que calculo el hilo de trabajo.
+# Solo se escriben las alturas sobre la malla del nivel correspondiente; el
+# rango de alturas es fijo, asi que la barra de colores no necesita rehacerse
+def apply_terrain(step):
+    result = terrain_worker.poll()
+    if result is not None:
+        stride, z = result
+        if stride == "adaptive":
+            # Se guarda junto a los niveles de detalle para que siga viva
+            # mientras el actor la dibuja
+            mesh = lod_meshes["adaptive"] = adaptive_mesh(*z)
+        else:
+            mesh = lod_mesh(stride)
+            update_heights(mesh, z)
+        if actor.mapper.dataset is not mesh:
+            actor.mapper.dataset = mesh  # Cambiar de nivel de detalle
+        with profiling.timer("main2.render"):
+            plotter.render()  # Renderizar la escena actualizada
+        profiling.count("main2.terrains_applied")
+    profiling.maybe_report()
+
+terrain_worker = TerrainWorker(terrain_levels)
+plotter.add_timer_event(max_steps=2**31 - 1, duration=30, callback=apply_terrain)
+if adaptive_error is not None:
+    # La malla inicial es la grilla uniforme; pedir tambien la adaptativa
+    terrain_worker.submit(octaves, persistence, lacunarity)
 
 # Crear los sliders y vincular la funcion de actualizacion
-create_sliders(plotter, update_mesh)
+create_sliders(plotter, update_mesh, terrain_worker.finish)
 
 # Configurar la visualizacion
 plotter.view_isometric()
 plotter.set_background("skyblue")  # Fondo negro
 #plotter.set_background("black")
 plotter.show()
+terrain_worker.shutdown()
 
 
 
@@ -0,0 +1,191 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import profiling
+
+# Tabla de permutacion de Ken Perlin (la misma que usa la libreria `noise`),
+# duplicada para poder indexar PERM[A + j] sin aplicar modulo
+_P = [
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140,
+    36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120,
+    234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57, 177, 33,
+    88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71,
+    134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133,
+    230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161,
+    1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169, 200, 196, 135, 130,
+    116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250,
+    124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227,
+    47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44,
+    154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98,
+    108, 110, 79, 113, 224, 232, 178, 185, 112, 104, 218, 246, 97, 228, 251, 34,
+    242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145, 235, 249, 14,
+    239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121,
+    50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243,
+    141, 128, 195, 78, 66, 215, 61, 156, 180,
+]
+PERM = np.array(_P + _P, dtype=np.int32)
+
+# Componentes (x, y) de los 16 gradientes GRAD3 usados por pnoise2
+GRAD2 = np.array(
+    [
+        [1, 1], [-1, 1], [1, -1], [-1, -1],
+        [1, 0], [-1, 0], [1, 0], [-1, 0],
+        [0, 1], [0, -1], [0, 1], [0, -1],
+        [1, 0], [-1, 0], [0, -1], [0, 1],
+    ],
+    dtype=np.float32,
+)
+
+# Gradiente asociado a cada entrada de PERM, para resolver PERM[h] -> GRAD2 en
+# una sola indexacion
+_GX = GRAD2[PERM & 15, 0]
+_GY = GRAD2[PERM & 15, 1]
+
+
+def _grad2(h, x, y):
+    return x * _GX[h] + y * _GY[h]
+
+
+def _lerp(t, a, b):
+    return a + t * (b - a)
+
+
+def pnoise2(x, y, repeatx=1024, repeaty=1024, base=0):
+    """
+    Ruido de Perlin 2D evaluado sobre arreglos completos.
+    Replica `noise.pnoise2` (una octava), incluida su aritmetica en float32,
+    de modo que un mismo punto entrega el mismo valor que la version escalar.
+    :param x: Coordenadas x (escalar o arreglo de cualquier forma).
+    :param y: Coordenadas y (misma forma que x).
+    :param repeatx: Periodo del ruido en x.
+    :param repeaty: Periodo del ruido en y.
+    :param base: Desplazamiento de la tabla de permutacion.
+    :return: Arreglo float64 con el ruido en cada punto.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    repeatx = np.float32(repeatx)
+    repeaty = np.float32(repeaty)
+
+    # Celda de la grilla (con el mismo manejo de repeticion que la version en C)
+    i = np.floor(np.fmod(x, repeatx)).astype(np.int32)
+    j = np.floor(np.fmod(y, repeaty)).astype(np.int32)
+    ii = np.fmod((i + 1).astype(np.float32), repeatx).astype(np.int32)
+    jj = np.fmod((j + 1).astype(np.float32), repeaty).astype(np.int32)
+    i = (i & 255) + base
+    j = (j & 255) + base
+    ii = (ii & 255) + base
+    jj = (jj & 255) + base
+
+    # Posicion dentro de la celda y curva de suavizado
+    x = x - np.floor(x)
+    y = y - np.floor(y)
+    fx = x * x * x * (x * (x * 6 - 15) + 10)
+    fy = y * y * y * (y * (y * 6 - 15) + 10)
+
+    A = PERM[i]
+    AA = PERM[A + j]
+    AB = PERM[A + jj]
+    B = PERM[ii]
+    BA = PERM[B + j]
+    BB = PERM[B + jj]
+
+    one = np.float32(1)
+    result = _lerp(
+        fy,
+        _lerp(fx, _grad2(AA, x, y), _grad2(BA, x - one, y)),
+        _lerp(fx, _grad2(AB, x, y - one), _grad2(BB, x - one, y - one)),
+    )
+    return result.astype(np.float64)
+
+
+class OctaveCache:
+    """
+    Cache LRU de capas de ruido: cada capa es una octava (pnoise2 a una
+    frecuencia dada) evaluada sobre un dominio completo. Las capas no dependen
+    de la amplitud, asi que al cambiar la persistencia se reutilizan todas y al
+    subir las octavas solo se calculan las nuevas.
+    Las capas se guardan en float32, que es la precision en que pnoise2 las
+    calcula, por lo que no se pierde nada al reutilizarlas.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+        """
+        :param max_bytes: Memoria maxima ocupada por las capas guardadas.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._layers = OrderedDict()
+
+    def __len__(self):
+        return len(self._layers)
+
+    def get(self, key, compute):
+        """
+        Devuelve la capa asociada a `key`, calculandola con `compute()` si no
+        esta guardada. El arreglo devuelto es de solo lectura.
+        """
+        layer = self._layers.get(key)
+        if layer is not None:
+            self._layers.move_to_end(key)
+            profiling.count("octave_cache.hits")
+            return layer
+        profiling.count("octave_cache.misses")
+
+        layer = np.asarray(compute(), dtype=np.float32)
+        layer.flags.writeable = False
+        self._layers[key] = layer
+        self.nbytes += layer.nbytes
+        # Descartar las capas usadas hace mas tiempo (siempre se conserva la nueva)
+        while self.nbytes > self.max_bytes and len(self._layers) > 1:
+            _, old = self._layers.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return layer
+
+    def clear(self):
+        self._layers.clear()
+        self.nbytes = 0
+
+
+@profiling.timed("perlin.fbm")
+def fbm(x, y, octaves, persistence, lacunarity, offset_x=0, offset_y=0,
+        cache=None, key=None):
+    """
+    Movimiento browniano fractal sobre arreglos completos: una llamada
+    vectorizada a pnoise2 por octava en lugar de una por punto.
+    :param x: Coordenadas x (arreglo).
+    :param y: Coordenadas y (arreglo).
+    :param octaves: Numero de octavas.
+    :param persistence: Factor de amplitud entre octavas.
+    :param lacunarity: Factor de frecuencia entre octavas.
+    :param offset_x: Desplazamiento del dominio en x.
+    :param offset_y: Desplazamiento del dominio en y.
+    :param cache: OctaveCache opcional donde reutilizar las capas.
+    :param key: Identificador (hashable) del dominio x, y, por ejemplo su
+                resolucion y transformacion; obligatorio si se usa cache.
+    :return: Arreglo float64 normalizado por la suma de amplitudes.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    total = np.zeros(np.broadcast(x, y).shape)
+    frequency = 1
+    amplitude = 1
+    max_value = 0
+    for i in range(octaves):
+        def layer(frequency=frequency):
+            return pnoise2(x * frequency + offset_x,
+                           y * frequency + offset_y,
+                           repeatx=1024, repeaty=1024)
+
+        if cache is None:
+            samples = layer()
+        else:
+            samples = cache.get((offset_x, offset_y, key, frequency), layer)
+        # Acumular en float64 aunque la capa venga en float32 desde la cache
+        total += np.multiply(samples, amplitude, dtype=np.float64)
+        max_value += amplitude
+        amplitude *= persistence
+        frequency *= lacunarity
+
+    return total / max_value
@@ -0,0 +1,189 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+import numpy as np
+
+# Medicion opcional de las etapas costosas (ruido, normalizacion, mallas de
+# PyVista, subidas a la GPU, on_draw...): temporizadores por bloque y
+# contadores, agrupados por nombre de etapa. Esta desactivada por defecto y en
+# ese caso timer() devuelve un contexto vacio compartido y las funciones con
+# @timed solo revisan una variable global, asi que casi no cuesta nada.
+# Se activa con la variable de entorno MALLAS_PROFILE=1 (o con enable()):
+#   MALLAS_PROFILE=1 python vis.py
+#   MALLAS_PROFILE=1 MALLAS_PROFILE_JSON=perfil.json python main2.py
+# Al salir se imprime un resumen con los percentiles de cada etapa (y se
+# guarda en JSON si se indica MALLAS_PROFILE_JSON); los visores ademas lo
+# imprimen cada MALLAS_PROFILE_INTERVAL segundos (ver maybe_report).
+
+ENABLED = os.environ.get("MALLAS_PROFILE", "") not in ("", "0")
+JSON_PATH = os.environ.get("MALLAS_PROFILE_JSON") or None
+INTERVAL = float(os.environ.get("MALLAS_PROFILE_INTERVAL", "10"))
+
+# Mediciones guardadas por etapa para los percentiles (las mas recientes)
+MAX_SAMPLES = 10000
+
+_lock = threading.Lock()
+_samples = {}   # etapa -> deque de duraciones en segundos
+_totals = {}    # etapa -> [llamadas, segundos]
+_counters = {}  # nombre -> valor
+_last_report = time.monotonic()
+_null = nullcontext()
+
+
+def enable(json_path=None, interval=None):
+    """
+    Activa la medicion desde el codigo (por ejemplo con una opcion --profile).
+    :param json_path: Archivo donde guardar el resumen al salir.
+    :param interval: Segundos entre resumenes de maybe_report (0: solo al salir).
+    """
+    global ENABLED, JSON_PATH, INTERVAL
+    ENABLED = True
+    if json_path is not None:
+        JSON_PATH = json_path
+    if interval is not None:
+        INTERVAL = interval
+
+def record(name, seconds):
+    """
+    Agrega una medicion de `seconds` a la etapa `name`.
+    """
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=MAX_SAMPLES)
+            _totals[name] = [0, 0.0]
+        samples.append(seconds)
+        totals = _totals[name]
+        totals[0] += 1
+        totals[1] += seconds
+
+def count(name, n=1):
+    """
+    Suma `n` al contador `name` (triangulos dibujados, bytes subidos...).
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+def timer(name):
+    """
+    Contexto que mide la duracion de un bloque:
+        with profiling.timer("terrain.noise"):
+            ...
+    """
+    return _Timer(name) if ENABLED else _null
+
+def timed(name):
+    """
+    Decorador que mide cada llamada a una funcion como la etapa `name`. No
+    sirve para generadores (solo mediria su creacion).
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def summary():
+    """
+    Resumen de las mediciones.
+    :return: Diccionario con "stages" (por etapa: llamadas, tiempo total y
+             promedio, percentiles 50/90/99 y maximo en milisegundos de las
+             ultimas MAX_SAMPLES mediciones) y "counters".
+    """
+    with _lock:
+        samples = {name: np.array(values) for name, values in _samples.items()}
+        totals = {name: tuple(values) for name, values in _totals.items()}
+        counters = dict(_counters)
+
+    stages = {}
+    for name, values in samples.items():
+        calls, total = totals[name]
+        p50, p90, p99 = 1000 * np.percentile(values, (50, 90, 99))
+        stages[name] = {"calls": calls, "total_s": total, "mean_ms": 1000 * total / calls,
+                        "p50_ms": p50, "p90_ms": p90, "p99_ms": p99,
+                        "max_ms": 1000 * values.max()}
+    return {"stages": stages, "counters": counters}
+
+def report(file=None):
+    """
+    Imprime el resumen como tabla, de la etapa con mas tiempo total a la de menos.
+    """
+    file = file if file is not None else sys.stderr
+    data = summary()
+    print(f"{'etapa':32} {'llamadas':>9} {'total s':>9} {'media ms':>9} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}", file=file)
+    for name, s in sorted(data["stages"].items(), key=lambda item: -item[1]["total_s"]):
+        print(f"{name:32} {s['calls']:9d} {s['total_s']:9.3f} {s['mean_ms']:9.2f} "
+              f"{s['p50_ms']:9.2f} {s['p90_ms']:9.2f} {s['p99_ms']:9.2f} {s['max_ms']:9.2f}",
+              file=file)
+    for name, value in sorted(data["counters"].items()):
+        print(f"{name:32} {value:>19,}", file=file)
+    file.flush()
+
+def dump(path):
+    """
+    Guarda el resumen en un archivo JSON.
+    """
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+def maybe_report():
+    """
+    Imprime el resumen si pasaron INTERVAL segundos desde el anterior; se
+    llama en cada cuadro de los visores.
+    """
+    global _last_report
+    if not ENABLED or INTERVAL <= 0:
+        return
+    now = time.monotonic()
+    if now - _last_report >= INTERVAL:
+        _last_report = now
+        report()
+
+def reset():
+    """
+    Borra todas las mediciones y contadores.
+    """
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+@atexit.register
+def _report_at_exit():
+    if not ENABLED or not _samples and not _counters:
+        return
+    report()
+    if JSON_PATH is not None:
+        dump(JSON_PATH)
@@ -1,8 +1,6 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import turtle 
-import random
 
 f_1 = np.array([[0.0, 0.0], [0.0, 0.16]])
 f_2 = np.array([[0.85, 0.04], [-0.04, 0.85]])
@@ -20,53 +18,171 @@ fs_4 = np.array([[0.0], [0.44]])
 #f_4 = np.array([[-0.1, 0.4], [0.4, 0.1]])
 #fs_4 = np.array([[0.2], [0.6]])
 
-def barnsley_fern(n):
-    x, y = 0,0
-    points = []
-    for i in range(n):
-        f = random.random()
-        if f < 0.01:
-            new_p = np.dot(f_1, np.array([x, y]))
-        elif f < 0.86:
-            new_p = np.dot(f_2, np.array([x, y])) + fs_2.flatten()
-        elif f < 0.93:
-            new_p = np.dot(f_3, np.array([x, y])) + fs_3.flatten()
-        else:
-            new_p = np.dot(f_4, np.array([x, y])) + fs_4.flatten()
-        
-        points.append(new_p)
-        x, y = new_p[0], new_p[1]
-
-    return np.array(points)
-
-def plot_fern(n):
+# Tabla de mapas afines del helecho (x' = A x + b), con la probabilidad de cada uno
+fern_matrices = np.stack([f_1, f_2, f_3, f_4])
+fern_translations = np.stack([np.zeros(2), fs_2.flatten(), fs_3.flatten(), fs_4.flatten()])
+fern_probabilities = np.array([0.01, 0.85, 0.07, 0.07])
+
+def ifs_chunks(n, matrices, translations, probabilities, chains=4096, burn_in=20, seed=None):
+    """
+    Juego del caos para un sistema de funciones iteradas (IFS) cualquiera.
+    Avanza `chains` cadenas independientes a la vez: en cada paso se elige un
+    mapa por cadena y se aplica a todas juntas como operaciones de arreglos.
+    :param n: Numero total de puntos a generar.
+    :param matrices: Matrices (m, 2, 2) de los mapas afines.
+    :param translations: Traslaciones (m, 2) de los mapas afines.
+    :param probabilities: Probabilidad (m,) de elegir cada mapa.
+    :param chains: Numero de cadenas que avanzan en paralelo.
+    :param burn_in: Pasos iniciales descartados, mientras las cadenas caen
+                    sobre el atractor.
+    :param seed: Semilla del generador aleatorio.
+    :return: Generador de pares (x, y) con los puntos de cada paso; los
+             arreglos se reutilizan, asi que hay que copiarlos antes del
+             siguiente paso si se quieren conservar.
+    """
+    rng = np.random.default_rng(seed)
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 2, 2)
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 2)
+    cumulative = np.cumsum(probabilities, dtype=np.float64)
+    cumulative /= cumulative[-1]
+    last = len(cumulative) - 1
+
+    # Coeficientes de x' = a x + b y + e, y' = c x + d y + f
+    a, b = matrices[:, 0, 0], matrices[:, 0, 1]
+    c, d = matrices[:, 1, 0], matrices[:, 1, 1]
+    e, f = translations[:, 0], translations[:, 1]
+
+    k = max(1, min(chains, n))
+    x = np.zeros(k)
+    y = np.zeros(k)
+    remaining = n
+    step = 0
+    while remaining > 0:
+        # Eleccion del mapa de cada cadena segun las probabilidades acumuladas
+        i = np.minimum(np.searchsorted(cumulative, rng.random(k), side="right"), last)
+        x, y = a[i] * x + b[i] * y + e[i], c[i] * x + d[i] * y + f[i]
+        step += 1
+        if step > burn_in:
+            m = min(k, remaining)
+            yield x[:m], y[:m]
+            remaining -= m
+
+def chaos_game(n, matrices, translations, probabilities, chains=4096, burn_in=20, seed=None,
+               out=None):
+    """
+    Genera n puntos del atractor de un IFS (ver ifs_chunks) en un arreglo
+    reservado de antemano.
+    :param out: Arreglo (n, 2) donde escribir los puntos; por defecto se crea
+                uno float32.
+    :return: Arreglo (n, 2) con los puntos.
+    """
+    if out is None:
+        out = np.empty((n, 2), dtype=np.float32)
+    start = 0
+    for x, y in ifs_chunks(n, matrices, translations, probabilities, chains, burn_in, seed):
+        end = start + len(x)
+        out[start:end, 0] = x
+        out[start:end, 1] = y
+        start = end
+    return out
+
+def barnsley_fern(n, chains=4096, seed=None):
+    return chaos_game(n, fern_matrices, fern_translations, fern_probabilities, chains,
+                      seed=seed)
+
+# Region que ocupa el helecho: (x_min, x_max, y_min, y_max)
+fern_extent = (-2.2, 2.7, 0.0, 10.0)
+
+def ifs_density(n, matrices, translations, probabilities, bins, extent, chains=2**16,
+                burn_in=20, seed=None):
+    """
+    Densidad de puntos del atractor de un IFS: cuenta cuantos puntos caen en
+    cada celda de una grilla fija, acumulando bloque a bloque mientras se
+    generan. Nunca se guarda la lista de puntos, asi que la memoria no depende
+    de n.
+    :param bins: (columnas, filas) de la grilla.
+    :param extent: Region (x_min, x_max, y_min, y_max) cubierta por la grilla;
+                   los puntos fuera de ella se descartan.
+    :return: Arreglo (filas, columnas) de cuentas, con la fila 0 abajo.
+    """
+    cols, rows = bins
+    x_min, x_max, y_min, y_max = extent
+    sx = cols / (x_max - x_min)
+    sy = rows / (y_max - y_min)
+    counts = np.zeros(rows * cols, dtype=np.int64)
+    for x, y in ifs_chunks(n, matrices, translations, probabilities, chains, burn_in, seed):
+        j = np.floor((x - x_min) * sx).astype(np.int64)
+        i = np.floor((y - y_min) * sy).astype(np.int64)
+        inside = (j >= 0) & (j < cols) & (i >= 0) & (i < rows)
+        counts += np.bincount(i[inside] * cols + j[inside], minlength=rows * cols)
+    return counts.reshape(rows, cols)
+
+def fern_density(n, bins=(500, 1000), extent=fern_extent, seed=None):
+    return ifs_density(n, fern_matrices, fern_translations, fern_probabilities, bins, extent,
+                       seed=seed)
+
+def plot_density(counts, extent):
+    # Escala logaritmica para que se vean tanto las hojas densas como las puntas;
+    # las celdas vacias quedan transparentes
+    plt.imshow(np.ma.masked_equal(np.log1p(counts), 0), origin='lower', extent=extent, cmap='Greens',
+               interpolation='nearest')
+
+def plot_fern(n, density=False):
+    if density:
+        plot_density(fern_density(n), fern_extent)
+        plt.show()
+        return
     result = barnsley_fern(n)
     x = result[:,0]
     y = result[:,1]
     plt.scatter(x, y, s=1, c='g')
     plt.show()
 
-def draw_fern(n):
-    result = barnsley_fern(n)
-    print(result.shape)
-    pen = turtle.Turtle()
-    pen.speed(0)
-    pen.hideturtle()
-    pen.color('green')
-    pen.penup()
-    for i in range(n):
-        x = result[i][0]
-        y = result[i][1]
-        pen.goto(x*50, y*50-200)
-        pen.dot()
-
-    turtle.done()
-
-def plot_fern_vertical(n, scale_x=0.5, scale_y=1.5):
-    result = barnsley_fern(n)
-    x = result[:, 0] * scale_x  # Ajustar el ancho
-    y = result[:, 1] * scale_y  # Ajustar la altura
-    plt.scatter(x, y, s=1, c='g')
+# Lienzo de draw_fern: tamaño en pixeles (ancho, alto) y la misma escala y
+# desplazamiento que usaba el dibujo con turtle (x*50, y*50 - 200)
+canvas_size = (400, 600)
+canvas_scale = 50
+canvas_offset = (0, -200)
+
+def draw_fern(n, path=None):
+    """
+    Dibuja el helecho pintando los pixeles de una imagen en lugar de un punto
+    de turtle por vez: los puntos se acumulan por bloques sobre la grilla de
+    pixeles del lienzo (ver ifs_density).
+    :param path: Archivo donde guardar la imagen; si no se indica se muestra.
+    :return: Imagen RGB (alto, ancho, 3) en uint8.
+    """
+    w, h = canvas_size
+    # Region del plano que cubre el lienzo (centrado en el origen, como turtle)
+    extent = (
+        (-w / 2 - canvas_offset[0]) / canvas_scale,
+        (w / 2 - canvas_offset[0]) / canvas_scale,
+        (-h / 2 - canvas_offset[1]) / canvas_scale,
+        (h / 2 - canvas_offset[1]) / canvas_scale,
+    )
+    counts = fern_density(n, bins=(w, h), extent=extent)
+
+    image = np.full((h, w, 3), 255, dtype=np.uint8)
+    image[counts[::-1] > 0] = (0, 128, 0)  # Fila 0 de la imagen arriba; verde de turtle
+    if path is not None:
+        plt.imsave(path, image)
+    else:
+        plt.imshow(image)
+        plt.axis('off')
+        plt.show()
+    return image
+
+def plot_fern_vertical(n, scale_x=0.5, scale_y=1.5, density=False):
+    if density:
+        # La densidad se acumula sin escalar y el escalado se aplica al extent
+        x_min, x_max, y_min, y_max = fern_extent
+        plot_density(fern_density(n), (x_min * scale_x, x_max * scale_x,
+                                       y_min * scale_y, y_max * scale_y))
+    else:
+        result = barnsley_fern(n)
+        x = result[:, 0] * scale_x  # Ajustar el ancho
+        y = result[:, 1] * scale_y  # Ajustar la altura
+        plt.scatter(x, y, s=1, c='g')
     plt.gca().set_aspect('equal', adjustable='datalim')  # Asegurar proporciones consistentes
     plt.title("Barnsley Fern (Ajustado)")
     plt.xlabel("X (ajustado)")
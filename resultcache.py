@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Cache en disco de resultados de generadores deterministas (terrenos,
+# fractales): cada resultado se guarda en un .npz cuyo nombre es el hash del
+# generador, sus parametros y la version del codigo que lo calcula, asi que al
+# cambiar cualquiera de ellos simplemente se usa otro archivo. Las escrituras
+# son atomicas (archivo temporal + os.replace) y, al superar el tamaño maximo,
+# se borran los archivos usados hace mas tiempo (segun su fecha de
+# modificacion, que se actualiza en cada lectura).
+
+# Directorio por defecto; se puede cambiar con la variable de entorno
+# MALLAS_CACHE_DIR, y MALLAS_NO_CACHE=1 desactiva la cache
+CACHE_DIR = os.environ.get("MALLAS_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "proyecto-mallas")
+
+
+def code_version(*modules):
+    """
+    Version del codigo de unos modulos: hash del contenido de sus archivos.
+    :param modules: Modulos de los que depende el resultado (p. ej. perlin, terrain).
+    :return: Cadena hexadecimal.
+    """
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def _jsonable(value):
+    # Escalares de NumPy como numeros de Python, para que 3 y np.int64(3) den
+    # la misma clave
+    return value.item() if isinstance(value, np.generic) else repr(value)
+
+
+class ResultCache:
+    """
+    Cache en disco de arreglos NumPy (o tuplas de ellos), con direccion por
+    contenido y tamaño acotado (LRU). Se puede usar desde varios hilos o
+    procesos a la vez: cada escritura va a su propio archivo temporal.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=2 * 2**30, enabled=None):
+        """
+        :param directory: Carpeta donde guardar los resultados.
+        :param max_bytes: Tamaño maximo de la carpeta.
+        :param enabled: Si es False no se lee ni escribe nada; por defecto se
+                        desactiva con la variable de entorno MALLAS_NO_CACHE.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if enabled is None:
+            enabled = os.environ.get("MALLAS_NO_CACHE", "") in ("", "0")
+        self.enabled = enabled
+
+    @staticmethod
+    def key(name, version, **params):
+        """
+        Clave de un resultado: hash del generador, la version y los parametros.
+        """
+        text = json.dumps([name, version, params], sort_keys=True, default=_jsonable)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        :return: Resultado (arreglo o tupla de arreglos) guardado con `key`, o
+                 None si no esta.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = tuple(data[f"arr_{i}"] for i in range(len(data.files) - 1))
+                single = bool(data["single"])
+            os.utime(path)  # Marcarlo como usado recientemente
+        except (OSError, ValueError, KeyError):
+            return None  # No esta, o quedo incompleto o es de otro formato
+        return arrays[0] if single else arrays
+
+    def put(self, key, result):
+        """
+        Guarda un arreglo o una tupla de arreglos de forma atomica y luego
+        aplica el limite de tamaño.
+        """
+        if not self.enabled:
+            return
+        single = isinstance(result, np.ndarray)
+        arrays = (result,) if single else tuple(result)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, *arrays, single=single)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Borra los resultados usados hace mas tiempo hasta quedar bajo max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Lo borro otro proceso
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def cached(self, name, compute, version, **params):
+        """
+        Devuelve el resultado de compute() leyendolo del disco si ya se
+        calculo con el mismo generador, version y parametros.
+        :param name: Nombre del generador.
+        :param compute: Funcion sin argumentos que devuelve un arreglo o una
+                        tupla de arreglos.
+        :param version: Version del codigo (ver code_version).
+        :param params: Parametros que determinan el resultado.
+        :return: Lo mismo que compute().
+        """
+        key = self.key(name, version, **params)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
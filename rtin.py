@@ -0,0 +1,127 @@
+import numpy as np
+
+# Simplificacion adaptativa de mapas de alturas con una triangulacion RTIN
+# (right-triangulated irregular network, como Martini de Mapbox): la grilla de
+# (2^k + 1) x (2^k + 1) puntos se cubre con triangulos rectangulos que se
+# parten en dos por el punto medio de su hipotenusa. Cada triangulo se parte
+# solo si al no hacerlo el error vertical supera el maximo pedido, asi que las
+# zonas planas quedan con pocos triangulos grandes y las montañas con muchos
+# pequeños. El error de cada punto incluye el de los puntos que dependen de
+# el, lo que garantiza que la malla no tenga grietas entre triangulos vecinos.
+# Todo se calcula por niveles de subdivision, un nivel a la vez.
+
+
+def rtin_size(n, round_up=True):
+    """
+    Resolucion de la forma 2^k + 1 mas cercana a una grilla de n puntos por
+    lado; RTIN solo trabaja sobre grillas de ese tamaño.
+    :param round_up: Si es True, la menor que cubre n; si no, la mayor que no
+                     supera n (para no terminar con mas puntos que la grilla).
+    """
+    log = np.log2(max(n - 1, 1))
+    return 2 ** max(1, int(np.ceil(log) if round_up else np.floor(log))) + 1
+
+def _levels(size):
+    # Triangulos de cada nivel de subdivision, como arreglos (m, 3, 2) de
+    # coordenadas enteras (columna, fila) de sus vertices a, b, c (ab es la
+    # hipotenusa). Solo hasta los triangulos cuya hipotenusa tiene punto medio.
+    tile = size - 1
+    triangles = np.array([[[tile, tile], [0, 0], [0, tile]],
+                          [[0, 0], [tile, tile], [tile, 0]]], dtype=np.int64)
+    levels = []
+    while True:
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        if np.abs(a - c).sum(axis=1).max() < 2:
+            return levels
+        levels.append(triangles)
+        triangles = _split(triangles)
+
+def _split(triangles):
+    # Hijos (c, a, m) y (b, c, m) de cada triangulo, con m el punto medio de ab
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    m = (a + b) // 2
+    children = np.stack([np.stack([c, a, m], axis=1), np.stack([b, c, m], axis=1)], axis=1)
+    return children.reshape(-1, 3, 2)
+
+def rtin_errors(z):
+    """
+    Error de aproximacion de cada punto de la grilla: la mayor diferencia de
+    altura que aparece si el punto (y los que dependen de el) no se usan.
+    :param z: Alturas (size, size) con size = 2^k + 1, fila por fila.
+    :return: Arreglo (size, size) de errores.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    size = z.shape[0]
+    if z.shape != (size, size) or size != rtin_size(size):
+        raise ValueError(f"RTIN necesita una grilla cuadrada de 2^k + 1 puntos, no {z.shape}")
+
+    errors = np.zeros((size, size))
+    levels = _levels(size)
+    # De los triangulos mas pequeños a los mas grandes
+    for depth, triangles in reversed(list(enumerate(levels))):
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        m = (a + b) // 2
+        interpolated = (z[a[:, 1], a[:, 0]] + z[b[:, 1], b[:, 0]]) / 2
+        error = np.abs(interpolated - z[m[:, 1], m[:, 0]])
+        if depth < len(levels) - 1:
+            # Los hijos dependen de este punto medio: heredar sus errores
+            left = (c + a) // 2
+            right = (b + c) // 2
+            error = np.maximum(error, np.maximum(errors[left[:, 1], left[:, 0]],
+                                                 errors[right[:, 1], right[:, 0]]))
+        # Dos triangulos vecinos comparten cada hipotenusa
+        np.maximum.at(errors, (m[:, 1], m[:, 0]), error)
+    return errors
+
+def rtin_triangles(errors, max_error):
+    """
+    Triangulos de la malla adaptativa para un error maximo.
+    :param errors: Errores de rtin_errors.
+    :param max_error: Diferencia vertical maxima permitida.
+    :return: Arreglo (m, 3) de indices de la grilla (fila * size + columna),
+             en sentido antihorario visto desde +z.
+    """
+    size = errors.shape[0]
+    tile = size - 1
+    triangles = np.array([[[tile, tile], [0, 0], [0, tile]],
+                          [[0, 0], [tile, tile], [tile, 0]]], dtype=np.int64)
+    kept = []
+    while len(triangles):
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        m = (a + b) // 2
+        split = (np.abs(a - c).sum(axis=1) > 1) & (errors[m[:, 1], m[:, 0]] > max_error)
+        kept.append(triangles[~split])
+        triangles = _split(triangles[split])
+    triangles = np.concatenate(kept)
+
+    # Orientar todos los triangulos como los de grid_faces (normales hacia +z)
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    cross = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    flip = cross < 0
+    triangles[flip, 1], triangles[flip, 2] = c[flip], b[flip]
+    return triangles[:, :, 1] * size + triangles[:, :, 0]
+
+def rtin_mesh(z, max_error, errors=None):
+    """
+    Malla simplificada de un mapa de alturas sobre [-1, 1]^2.
+    :param z: Alturas (size, size) con size = 2^k + 1, ordenadas como
+              terrain.grid_points(size).
+    :param max_error: Diferencia vertical maxima entre la malla y la grilla.
+    :param errors: Errores ya calculados con rtin_errors(z), para probar
+                   varios errores maximos sin recalcularlos.
+    :return: (puntos (k, 3), caras en formato PyVista [3, a, b, c, ...]).
+    """
+    z = np.asarray(z, dtype=np.float64)
+    if errors is None:
+        errors = rtin_errors(z)
+    size = z.shape[0]
+    triangles = rtin_triangles(errors, max_error)
+
+    # Quedarse solo con los puntos usados y renumerarlos
+    used, inverse = np.unique(triangles, return_inverse=True)
+    axis = np.linspace(-1, 1, size)
+    points = np.c_[axis[used % size], axis[used // size], z.ravel()[used]]
+    faces = np.empty((len(triangles), 4), dtype=np.int64)
+    faces[:, 0] = 3
+    faces[:, 1:] = inverse.reshape(-1, 3)
+    return points, faces.ravel()
@@ -0,0 +1,281 @@
+import os
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+import perlin
+import profiling
+
+# Generacion del terreno sin dependencias de visualizacion (solo NumPy), para
+# poder usarla tanto desde el visor (main2.py) como en procesos por lotes
+
+# Limites para la altura z
+z_min_target = -0.05  # Profundidad maxima (mar)
+z_max_target = 0.2   # Altura maxima (montañas)
+
+# Cota de |pnoise2| (se alcanza en el centro de una celda cuando los cuatro
+# gradientes apuntan hacia el), y por lo tanto tambien de |fbm|
+NOISE_BOUND = 1.0
+
+# Rango que puede tomar combined_terrain para cualquier semilla y parametros:
+# las montañas van en [-2B, 2B], las planicies en [-0.6, B**0.25 - 0.6] y el
+# terreno combinado es un promedio ponderado de ambas
+TERRAIN_BOUNDS = (
+    min(-2 * NOISE_BOUND, -0.6),
+    max(2 * NOISE_BOUND, NOISE_BOUND**0.25 - 0.6),
+)
+
+
+def offsets_from_seed(seed):
+    """
+    Desplazamientos aleatorios (offset_x, offset_y) entre 0 y 10,000 para una
+    semilla; son los mismos que usa el visor (main2.py) con esa semilla.
+    """
+    rng = random.Random(seed)
+    return rng.randint(0, 10000), rng.randint(0, 10000)
+
+def _fbm(x, y, octaves, persistence, lacunarity, offsets, cache, domain):
+    # La cache solo se usa si se sabe a que dominio corresponden x, y
+    if domain is None:
+        cache = None
+    return perlin.fbm(x, y, octaves, persistence, lacunarity, *offsets,
+                      cache=cache, key=domain)
+
+def mountain_terrain(x, y, octaves, persistence, lacunarity, offsets=(0, 0),
+                     cache=None, domain=None):
+    if domain is not None:
+        domain = (domain, 6, 3)
+    return 2 * _fbm(x*6, y*3, octaves, persistence, lacunarity, offsets, cache, domain)
+
+def plains_terrain(x, y, octaves, persistence, lacunarity, offsets=(0, 0),
+                   cache=None, domain=None):
+    if domain is not None:
+        domain = (domain, 1, 1)
+    f = _fbm(x, y, octaves, persistence, lacunarity, offsets, cache, domain)
+    # Raiz cuarta con signo: para f < 0 es la parte real de f**0.25 compleja,
+    # que es lo que terminaba en la malla cuando se evaluaba punto a punto
+    root = np.abs(f)**0.25
+    return np.where(f < 0, np.cos(np.pi / 4) * root, root) - 0.6
+
+def simple_curve(x, y):
+    """
+    Define un peso basado en la distancia radial al origen.
+    La planicie se encuentra cerca del centro (distancia baja).
+    """
+    val = (x**2 + y**2)**0.5  # Distancia radial al origen
+    start = 0.3  # Radio interno de la planicie
+    end = 0.7    # Radio externo donde empiezan las montañas
+    # 1 dentro de la planicie, 0 en las montañas y transicion suave entre ambas
+    return np.clip((end - val) / (end - start), 0, 1)
+
+def combined_terrain(x, y, octaves, persistence, lacunarity, offsets=(0, 0),
+                     cache=None, domain=None):
+    """
+    Terreno crudo: montañas y planicie mezcladas segun simple_curve.
+    :param x: Coordenadas x (arreglo).
+    :param y: Coordenadas y (arreglo).
+    :param offsets: Desplazamientos (offset_x, offset_y) del ruido.
+    :param cache: perlin.OctaveCache opcional para reutilizar octavas.
+    :param domain: Identificador hashable de las coordenadas x, y (por ejemplo
+                   la resolucion de la grilla); sin el no se usa la cache.
+    :return: Arreglo con la altura sin normalizar, dentro de TERRAIN_BOUNDS.
+    """
+    m = mountain_terrain(x, y, octaves, persistence, lacunarity, offsets, cache, domain)
+    p = plains_terrain(x, y, octaves, persistence, lacunarity, offsets, cache, domain)
+    w = simple_curve(x, y)
+    return (1-w)*m + w*p
+
+@lru_cache(maxsize=4)
+def grid_points(n):
+    """
+    Puntos (x, y) de una grilla regular n x n sobre [-1, 1]^2, fila por fila.
+    :param n: Resolucion de la grilla.
+    :return: Arreglo (n*n, 2); se comparte entre llamadas, no modificar.
+    """
+    x = np.linspace(-1, 1, n)
+    y = np.linspace(-1, 1, n)
+    xx, yy = np.meshgrid(x, y)
+    return np.c_[xx.ravel(), yy.ravel()]
+
+@lru_cache(maxsize=4)
+def grid_faces(n):
+    """
+    Conectividad de la grilla n x n en formato de caras de PyVista.
+    Como la grilla es regular no hace falta triangular: cada celda se parte
+    en dos triangulos calculando sus indices directamente.
+    :param n: Resolucion de la grilla.
+    :return: Arreglo [3, a, b, c, 3, ...] de 2*(n-1)^2 triangulos; se
+             comparte entre llamadas, no modificar.
+    """
+    idx = np.arange(n * n, dtype=np.int64).reshape(n, n)
+    v00 = idx[:-1, :-1].ravel()  # (fila, columna)
+    v01 = idx[:-1, 1:].ravel()   # (fila, columna + 1)
+    v10 = idx[1:, :-1].ravel()   # (fila + 1, columna)
+    v11 = idx[1:, 1:].ravel()    # (fila + 1, columna + 1)
+
+    faces = np.empty((v00.size, 2, 4), dtype=np.int64)
+    faces[:, :, 0] = 3
+    faces[:, 0, 1:] = np.stack([v00, v01, v11], axis=1)
+    faces[:, 1, 1:] = np.stack([v00, v11, v10], axis=1)
+    return faces.ravel()
+
+def scale_heights(z, z_range=None):
+    """
+    Escala alturas crudas de combined_terrain al rango [z_min_target, z_max_target].
+    :param z: Alturas crudas.
+    :param z_range: (min, max) de referencia para normalizar. Por defecto se
+                    usa el minimo y maximo de z; con un rango fijo (por
+                    ejemplo TERRAIN_BOUNDS) el resultado no depende del trozo
+                    de terreno evaluado.
+    :return: Alturas escaladas.
+    """
+    # Calcular los valores minimo y maximo originales de z
+    if z_range is None:
+        z_min_original = np.min(z)
+        z_max_original = np.max(z)
+    else:
+        z_min_original, z_max_original = z_range
+
+    # Normalizar z entre 0 y 1
+    z_normalized = (z - z_min_original) / (z_max_original - z_min_original)
+
+    # Escalar z al rango deseado
+    return z_min_target + z_normalized * (z_max_target - z_min_target)
+
+def terrain_cache_params(n, octaves, persistence, lacunarity, offsets=(0, 0)):
+    """
+    Parametros de terrain_heights con tipos fijos, para la clave de la cache en
+    disco (ver resultcache.py): asi lacunarity=3 y lacunarity=3.0, que dan el
+    mismo terreno, comparten el resultado entre el visor y batch.py.
+    :return: Diccionario para ResultCache.key.
+    """
+    return {"n": int(n), "octaves": int(octaves), "persistence": float(persistence),
+            "lacunarity": float(lacunarity), "offsets": tuple(int(o) for o in offsets)}
+
+def terrain_heights(n, octaves, persistence, lacunarity, offsets=(0, 0), cache=None):
+    """
+    Alturas escaladas del terreno sobre la grilla n x n de [-1, 1]^2.
+    :return: Arreglo (n*n,) ordenado como grid_points(n).
+    """
+    points = grid_points(n)
+    with profiling.timer("terrain.noise"):
+        z = combined_terrain(points[:, 0], points[:, 1], octaves, persistence, lacunarity,
+                             offsets, cache, domain=n)
+    with profiling.timer("terrain.normalize"):
+        return scale_heights(z)
+
+def _band_view(shm, n, r0, r1):
+    # Filas [r0, r1) de las alturas n x n guardadas en memoria compartida
+    return np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)[r0:r1]
+
+def _terrain_band(shm_name, n, r0, r1, octaves, persistence, lacunarity, offsets):
+    # Proceso de trabajo: evalua el terreno crudo en una banda de filas y lo
+    # escribe directamente en la memoria compartida
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        band = _band_view(shm, n, r0, r1)
+        # Mismas coordenadas que grid_points(n), sin construir la grilla completa
+        xx, yy = np.meshgrid(np.linspace(-1, 1, n), np.linspace(-1, 1, n)[r0:r1])
+        band[:] = combined_terrain(xx, yy, octaves, persistence, lacunarity, offsets)
+        band_range = band.min(), band.max()
+        del band  # Liberar la vista antes de cerrar la memoria compartida
+        return band_range
+    finally:
+        shm.close()
+
+def _scale_band(shm_name, n, r0, r1, z_range):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        band = _band_view(shm, n, r0, r1)
+        band[:] = scale_heights(band, z_range)
+        del band
+    finally:
+        shm.close()
+
+def parallel_terrain_heights(n, octaves, persistence, lacunarity, offsets=(0, 0),
+                             workers=None):
+    """
+    Igual que terrain_heights (y con el mismo resultado, bit a bit), pero
+    repartiendo la grilla en bandas de filas entre varios procesos. Los
+    procesos escriben en un arreglo de memoria compartida, asi que los
+    resultados no se copian de vuelta entre procesos.
+    :param workers: Numero de procesos; por defecto uno por nucleo.
+    :return: Arreglo (n*n,) ordenado como grid_points(n).
+    """
+    workers = workers or os.cpu_count()
+    # Varias bandas por proceso para repartir mejor la carga
+    bounds = np.linspace(0, n, min(n, 4 * workers) + 1).astype(int)
+    bands = list(zip(bounds[:-1], bounds[1:]))
+
+    shm = shared_memory.SharedMemory(create=True, size=n * n * 8)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ranges = [f.result() for f in [
+                pool.submit(_terrain_band, shm.name, n, r0, r1, octaves, persistence,
+                            lacunarity, offsets)
+                for r0, r1 in bands
+            ]]
+            # La normalizacion usa el minimo y maximo de toda la grilla
+            z_range = min(r[0] for r in ranges), max(r[1] for r in ranges)
+            for f in [pool.submit(_scale_band, shm.name, n, r0, r1, z_range)
+                      for r0, r1 in bands]:
+                f.result()
+        z = np.ndarray((n * n,), dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return z
+
+def terrain_tile(i, j, octaves, persistence, lacunarity, offsets=(0, 0), tile_size=256,
+                 spacing=2 / 199, origin=(-1.0, -1.0), border=0, z_range=TERRAIN_BOUNDS):
+    """
+    Calcula un bloque (tile) de una grilla global de terreno, infinita.
+    Cada muestra depende solo de su posicion global y la normalizacion usa un
+    rango fijo, asi que los bloques son independientes entre si y sus bordes
+    coinciden sin importar el orden en que se generen.
+    :param i: Fila del bloque (eje y).
+    :param j: Columna del bloque (eje x).
+    :param tile_size: Muestras por lado de cada bloque.
+    :param spacing: Distancia entre muestras (por defecto la del visor, n=200).
+    :param origin: Coordenadas (x, y) de la muestra (0, 0) de la grilla global.
+    :param border: Muestras extra en los bordes derecho y superior; con 1 los
+                   bloques vecinos comparten su borde, como se necesita para
+                   armar mallas continuas.
+    :param z_range: Rango (min, max) de las alturas crudas usado para escalar.
+    :return: Alturas float32 de forma (tile_size + border, tile_size + border).
+    """
+    steps = np.arange(tile_size + border)
+    x = origin[0] + (j * tile_size + steps) * spacing
+    y = origin[1] + (i * tile_size + steps) * spacing
+    xx, yy = np.meshgrid(x, y)
+    z = combined_terrain(xx, yy, octaves, persistence, lacunarity, offsets)
+    return scale_heights(z, z_range).astype(np.float32)
+
+def terrain_tiles(rows, cols, octaves, persistence, lacunarity, offsets=(0, 0), **kwargs):
+    """
+    Genera uno a uno los bloques de una region de rows x cols bloques, fila
+    por fila. Los argumentos extra se pasan a terrain_tile.
+    :return: Generador de (fila, columna, alturas).
+    """
+    for i in range(rows):
+        for j in range(cols):
+            yield i, j, terrain_tile(i, j, octaves, persistence, lacunarity, offsets, **kwargs)
+
+def save_tiles(path, rows, cols, octaves, persistence, lacunarity, offsets=(0, 0),
+               tile_size=256, spacing=2 / 199, origin=(-1.0, -1.0), z_range=TERRAIN_BOUNDS):
+    """
+    Escribe en disco un mapa de alturas de (rows*tile_size, cols*tile_size)
+    generandolo bloque a bloque sobre un archivo .npy mapeado en memoria, de
+    modo que la memoria usada no depende del tamaño total.
+    :return: El mapa de alturas (np.memmap) escrito.
+    """
+    heights = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(rows * tile_size, cols * tile_size)
+    )
+    for i, j, tile in terrain_tiles(rows, cols, octaves, persistence, lacunarity, offsets,
+                                    tile_size=tile_size, spacing=spacing, origin=origin,
+                                    z_range=z_range):
+        heights[i * tile_size:(i + 1) * tile_size, j * tile_size:(j + 1) * tile_size] = tile
+    heights.flush()
+    return heights
@@ -1,6 +1,12 @@
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import pyglet
 from OpenGL import GL
 import numpy as np
+import fractals
+import profiling
+import resultcache
 from fractals import *
 
 # Funciones de transformación
@@ -34,6 +40,69 @@ class Controller:
     rotation_x = 0.0  # Rotación en eje X
     rotation_y = 0.0  # Rotación en eje Y
     dragging = False  # Estado del clic izquierdo + CTRL
+    instanced = True  # Dibujar un tetraedro base por instancia (tecla I)
+    overlay = False  # Mostrar tiempos de dibujo (tecla F3)
+    culling = True  # Dibujar solo los nodos visibles del árbol del fractal (tecla C)
+    lod_pixels = 2.0  # Tamaño en pixeles bajo el cual un nodo deja de subdividirse
+
+    # Atributos que cambian la matriz de modelo
+    _view = ("zoom", "x", "y", "z", "rotation_x", "rotation_y")
+    version = 0  # Aumenta cada vez que cambia la vista
+    _model = None  # Matriz de modelo de la versión actual
+
+    def __setattr__(self, name, value):
+        if name in self._view:
+            object.__setattr__(self, "_model", None)
+            object.__setattr__(self, "version", self.version + 1)
+        object.__setattr__(self, name, value)
+
+    def model_matrix(self):
+        """
+        Matriz de modelo translate * scale * rotate, recalculada solo cuando
+        cambia la vista.
+        :return: Arreglo de 16 float32 en orden de columnas, listo para el shader.
+        """
+        if self._model is None:
+            rotation = rotate_x(self.rotation_x) @ rotate_y(self.rotation_y)
+            model = translate(self.x, self.y, self.z) @ uniformScale(self.zoom) @ rotation
+            object.__setattr__(self, "_model", model.flatten(order="F"))
+        return self._model
+
+
+class FrameStats:
+    """
+    Estadísticas de dibujo para el overlay de depuración: tiempo de CPU de
+    on_draw (promedio de los últimos cuadros), llamadas de dibujo y
+    triángulos del último cuadro completo (el overlay se dibuja antes de
+    terminar el cuadro, así que muestra los del anterior).
+    """
+
+    def __init__(self, frames=60):
+        self.times = deque(maxlen=frames)
+        self.draw_calls = 0
+        self.triangles = 0
+        self._draw_calls = 0  # Contadores del cuadro en curso
+        self._triangles = 0
+
+    def begin_frame(self):
+        self._draw_calls = 0
+        self._triangles = 0
+
+    def count_draw(self, triangles=0):
+        """
+        Registra una llamada de dibujo del cuadro en curso.
+        """
+        self._draw_calls += 1
+        self._triangles += triangles
+
+    def end_frame(self):
+        self.draw_calls = self._draw_calls
+        self.triangles = self._triangles
+
+    def text(self):
+        cpu_ms = 1000 * sum(self.times) / max(1, len(self.times))
+        return (f"CPU on_draw: {cpu_ms:.2f} ms   draw calls: {self.draw_calls}   "
+                f"triangulos: {self.triangles:,}")
 
 
 controller = Controller()
@@ -41,19 +110,18 @@ controller = Controller()
 # Crear ventana de Pyglet
 win = pyglet.window.Window(800, 800, "Tetrahedron Fractal", resizable=False)
 
-# Inicializar vértices e índices del fractal
-vertices, indices = generate_sierpinsky3D(n=controller.level)
-vertices = vertices.flatten()
+# Sin instancias, los vértices e índices del fractal se suben con vértices
+# compartidos, para subir a la GPU cerca de la mitad de vértices; pyglet guarda
+# los índices como GL_UNSIGNED_INT, así que se convierten a uint32 al crear la
+# lista (ver IndexedLevel)
 
 # Configurar shaders
 vertex_shader_code = """
 #version 330
 in vec3 position;
-uniform mat4 scale;
-uniform mat4 translate;
-uniform mat4 rotate;
+uniform mat4 model;
 void main() {
-    gl_Position = translate * scale * rotate * vec4(position, 1.0);
+    gl_Position = model * vec4(position, 1.0);
 }
 """
 
@@ -69,32 +137,356 @@ vertex_shader = pyglet.graphics.shader.Shader(vertex_shader_code, "vertex")
 fragment_shader = pyglet.graphics.shader.Shader(fragment_shader_code, "fragment")
 shader_program = pyglet.graphics.shader.ShaderProgram(vertex_shader, fragment_shader)
 
-# Crear una lista inicializada para cargar datos en GPU
-gpu_data = shader_program.vertex_list_indexed(
-    len(vertices) // 3, GL.GL_TRIANGLES, indices.flatten().astype(np.uint32)
+# Shader para el modo con instancias: cada tetraedro es el tetraedro base
+# escalado y desplazado según su instancia (x, y, z, escala)
+instanced_vertex_shader_code = """
+#version 330
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec4 instance;
+uniform mat4 model;
+void main() {
+    vec3 world = instance.xyz + instance.w * position;
+    gl_Position = model * vec4(world, 1.0);
+}
+"""
+
+instanced_program = pyglet.graphics.shader.ShaderProgram(
+    pyglet.graphics.shader.Shader(instanced_vertex_shader_code, "vertex"),
+    pyglet.graphics.shader.Shader(fragment_shader_code, "fragment"),
 )
-gpu_data.position[:] = vertices
+
+
+class InstancedTetrahedra:
+    """
+    Fractal en la GPU como un solo tetraedro base (4 vértices, 12 índices) más
+    un buffer con una instancia (x, y, z, escala) por tetraedro, dibujado con
+    glDrawElementsInstanced. Sube 16 bytes por tetraedro en vez de sus vértices
+    e índices completos, lo que permite recorrer los niveles 10-12. Solo usa
+    funciones de OpenGL 3.3 core, disponibles también en Mesa llvmpipe.
+    """
+
+    @profiling.timed("vis.instanced_upload")
+    def __init__(self, instances):
+        """
+        :param instances: Arreglo (m, 4) de instancias, ver sierpinsky_instances.
+        """
+        base = BASE_TETRAHEDRON.astype(np.float32)
+        faces = TETRAHEDRON_FACES.astype(np.uint32)
+        instances = np.ascontiguousarray(instances, dtype=np.float32)
+        self.count = len(instances)
+        self.index_count = faces.size
+        self.triangles = self.count * len(faces)
+        self.nbytes = base.nbytes + instances.nbytes + faces.nbytes
+
+        self.vao = GL.glGenVertexArrays(1)
+        self.buffers = GL.glGenBuffers(3)
+        GL.glBindVertexArray(self.vao)
+
+        # Vértices del tetraedro base (location 0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[0])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, base.nbytes, base, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+
+        # Una instancia por tetraedro (location 1, avanza una vez por instancia)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[1])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, instances.nbytes, instances, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 4, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+        GL.glVertexAttribDivisor(1, 1)
+
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.buffers[2])
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, faces.nbytes, faces, GL.GL_STATIC_DRAW)
+
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        profiling.count("vis.uploaded_bytes", self.nbytes)
+
+    def update(self, instances):
+        """
+        Reemplaza el buffer de instancias, por ejemplo por los nodos visibles
+        del cuadro actual (ver visible_instances).
+        """
+        instances = np.ascontiguousarray(instances, dtype=np.float32)
+        with profiling.timer("vis.instanced_update"):
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[1])
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, instances.nbytes, instances, GL.GL_DYNAMIC_DRAW)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        profiling.count("vis.uploaded_bytes", instances.nbytes)
+        self.nbytes += instances.nbytes - 16 * self.count
+        self.count = len(instances)
+        self.triangles = self.count * len(TETRAHEDRON_FACES)
+
+    def draw(self, mode):
+        GL.glBindVertexArray(self.vao)
+        GL.glDrawElementsInstanced(mode, self.index_count, GL.GL_UNSIGNED_INT, None, self.count)
+        GL.glBindVertexArray(0)
+
+    def delete(self):
+        GL.glDeleteBuffers(3, self.buffers)
+        GL.glDeleteVertexArrays(1, [self.vao])
+
+
+class IndexedLevel:
+    """
+    Fractal en la GPU con vértices compartidos, en una lista de pyglet con su
+    propio batch: así sus buffers no se comparten con otros niveles y se
+    pueden liberar al descartarlo.
+    """
+
+    def __init__(self, vertices, indices):
+        """
+        :param vertices: Vértices (m, 3) de generate_sierpinsky3D(weld=True).
+        :param indices: Índices (k, 3) de los triángulos.
+        """
+        self.batch = pyglet.graphics.Batch()
+        with profiling.timer("vis.vertex_list_indexed"):
+            self.vertex_list = shader_program.vertex_list_indexed(
+                len(vertices), GL.GL_TRIANGLES, indices.flatten().astype(np.uint32),
+                batch=self.batch,
+            )
+            self.vertex_list.position[:] = vertices.flatten()
+        self.triangles = len(indices)
+        self.nbytes = 4 * (vertices.size + indices.size)
+        profiling.count("vis.uploaded_bytes", self.nbytes)
+
+    def draw(self, mode):
+        self.vertex_list.draw(mode)
+
+    def delete(self):
+        domain = self.vertex_list.domain
+        self.vertex_list.delete()
+        for buffer, _ in domain.buffer_attributes:
+            buffer.delete()
+        domain.index_buffer.delete()
+        domain.vao.delete()
+        self.batch = None
+
+
+# Cache en disco de los niveles ya generados (ver resultcache.py)
+result_cache = resultcache.ResultCache()
+fractals_version = resultcache.code_version(fractals)
+
+@profiling.timed("vis.generate_level")
+def generate_level(level, instanced):
+    """
+    Genera en la CPU los arreglos de un nivel del fractal (sin tocar OpenGL,
+    así que puede correr en otro hilo), o los lee de la cache en disco.
+    :return: Tupla de arreglos NumPy para upload_level.
+    """
+    if instanced:
+        return (result_cache.cached("sierpinsky_instances", lambda: sierpinsky_instances(level),
+                                    fractals_version, n=level),)
+    return result_cache.cached("generate_sierpinsky3D",
+                               lambda: generate_sierpinsky3D(n=level, weld=True),
+                               fractals_version, n=level, weld=True)
+
+def upload_level(arrays, instanced):
+    """
+    Sube a la GPU los arreglos de generate_level.
+    :return: (programa de shaders, datos en GPU con métodos draw y delete).
+    """
+    if instanced:
+        return instanced_program, InstancedTetrahedra(*arrays)
+    return shader_program, IndexedLevel(*arrays)
+
+def level_nbytes(level, instanced):
+    """
+    Estimación de la memoria (CPU + GPU) que ocupa un nivel, para no
+    adelantar niveles que no caben en la cache.
+    """
+    if instanced:
+        return 2 * 16 * 4**level
+    # Con vértices compartidos hay ~2 vértices por tetraedro y 12 índices
+    return 2 * (2 * 12 + 12 * 4) * 4**level
+
+
+class LevelCache:
+    """
+    Cache LRU de niveles del fractal: guarda los arreglos generados en la CPU
+    y sus buffers en la GPU, y descarta los usados hace más tiempo cuando se
+    supera el presupuesto de memoria, liberando sus buffers explícitamente.
+    Además puede generar un nivel en un hilo de fondo mientras se muestra
+    otro, para que el cambio de nivel solo tenga que subirlo a la GPU.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+        """
+        :param max_bytes: Memoria máxima (CPU + GPU) de los niveles guardados.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._levels = OrderedDict()  # (nivel, instanced) -> (arreglos, programa, gpu)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetch = None  # (clave, Future) del nivel que se genera de fondo
+
+    def get(self, level, instanced):
+        """
+        Devuelve el nivel listo para dibujar, generándolo y subiéndolo a la
+        GPU si no está guardado.
+        :return: (programa de shaders, datos en GPU).
+        """
+        key = (level, instanced)
+        entry = self._levels.get(key)
+        if entry is not None:
+            self._levels.move_to_end(key)
+            return entry[1], entry[2]
+
+        if self._prefetch is not None and self._prefetch[0] == key:
+            arrays = self._prefetch[1].result()
+            self._prefetch = None
+        else:
+            arrays = generate_level(level, instanced)
+        program, data = upload_level(arrays, instanced)
+
+        self._levels[key] = (arrays, program, data)
+        self.nbytes += sum(a.nbytes for a in arrays) + data.nbytes
+        # Descartar los niveles usados hace más tiempo (siempre se conserva el nuevo)
+        while self.nbytes > self.max_bytes and len(self._levels) > 1:
+            _, (old_arrays, _, old_data) = self._levels.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in old_arrays) + old_data.nbytes
+            old_data.delete()
+        return program, data
+
+    def prefetch(self, level, instanced):
+        """
+        Genera un nivel en un hilo de fondo, si no está guardado y cabe en la
+        cache. Reemplaza al nivel adelantado anterior si aún no empezó.
+        """
+        key = (level, instanced)
+        if key in self._levels or level_nbytes(level, instanced) > self.max_bytes:
+            return
+        if self._prefetch is not None:
+            if self._prefetch[0] == key:
+                return
+            self._prefetch[1].cancel()
+        self._prefetch = (key, self._executor.submit(generate_level, level, instanced))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for _, _, data in self._levels.values():
+            data.delete()
+        self._levels.clear()
+        self.nbytes = 0
+
+
+# Esfera que contiene al tetraedro base y, por lo tanto, a todo el subárbol de
+# cada nodo (los hijos del Sierpinski quedan dentro de su padre)
+BASE_CENTER = BASE_TETRAHEDRON.mean(axis=0)
+BASE_RADIUS = np.linalg.norm(BASE_TETRAHEDRON - BASE_CENTER, axis=1).max()
+
+@profiling.timed("vis.visible_instances")
+def visible_instances(level, model, width, pixels):
+    """
+    Recorre el fractal como un árbol 4-ario implícito (cada nodo es un
+    tetraedro y sus hijos los de subdivide_instances) y elige qué nodos
+    dibujar: descarta los subárboles fuera de la pantalla y deja de
+    subdividir los nodos que se ven más chicos que `pixels`. Así los
+    triángulos dibujados dependen de la resolución de la pantalla y no del
+    nivel. Se avanza un nivel del árbol a la vez, con todos sus nodos juntos.
+    :param level: Nivel máximo de subdivisión.
+    :param model: Matriz de modelo 4x4 (la proyección es ortográfica).
+    :param width: Ancho de la ventana en pixeles.
+    :param pixels: Diámetro en pixeles bajo el cual un nodo no se subdivide.
+    :return: Arreglo (m, 4) float32 de instancias a dibujar.
+    """
+    linear, shift = model[:3, :3], model[:3, 3]
+    radius_scale = BASE_RADIUS * np.linalg.norm(linear[:, 0])  # Rotación por zoom
+
+    nodes = np.array([[0.0, 0.0, 0.0, 1.0]], dtype=np.float32)
+    selected = []
+    for depth in range(level + 1):
+        centers = (nodes[:, :3] + nodes[:, 3:] * BASE_CENTER) @ linear.T + shift
+        radius = nodes[:, 3] * radius_scale
+        # La esfera debe tocar el cubo [-1, 1]^3 que se ve en pantalla
+        inside = np.all(np.abs(centers) - radius[:, None] <= 1, axis=1)
+        nodes, radius = nodes[inside], radius[inside]
+        if depth == level:
+            selected.append(nodes)
+            break
+        small = radius * width < pixels  # Diámetro 2r en coordenadas de [-1, 1]
+        selected.append(nodes[small])
+        nodes = subdivide_instances(nodes[~small], sierpinsky_step)
+    return np.concatenate(selected)
+
+
+def show_level(level):
+    """
+    Muestra un nivel desde la cache y adelanta el siguiente en segundo plano.
+    Con culling, los nodos se eligen en cada cambio de vista (ver update_visible).
+    """
+    global program, gpu_data
+    if controller.culling:
+        program, gpu_data = instanced_program, visible_data
+        return
+    program, gpu_data = level_cache.get(level, controller.instanced)
+    level_cache.prefetch(level + 1, controller.instanced)
+
+def update_visible():
+    """
+    Vuelve a elegir los nodos visibles si cambió la vista o el nivel.
+    """
+    global visible_key
+    key = (controller.version, controller.level)
+    if key != visible_key:
+        model = controller.model_matrix().reshape(4, 4, order="F")
+        visible_data.update(visible_instances(controller.level, model, win.width,
+                                              controller.lod_pixels))
+        visible_key = key
+
+
+# Cargar el nivel inicial en la GPU
+level_cache = LevelCache()
+visible_data = InstancedTetrahedra(sierpinsky_instances(0))
+visible_key = None  # (versión de la vista, nivel) de los nodos cargados
+show_level(controller.level)
+
+# Versión de la vista cargada en cada programa: los uniforms se conservan en
+# el programa, así que solo se vuelven a subir cuando la vista cambia
+uploaded_versions = {}
+
+frame_stats = FrameStats()
+overlay_label = pyglet.text.Label("", x=10, y=win.height - 10, anchor_y="top",
+                                  font_size=11, color=(255, 255, 0, 255))
 
 @win.event
 def on_draw():
+    start = time.perf_counter()
+    frame_stats.begin_frame()
     GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
     win.clear()
 
     GL.glEnable(GL.GL_DEPTH_TEST)
     GL.glPolygonMode(GL.GL_FRONT_AND_BACK, GL.GL_LINE)
 
-    shader_program.use()
-    shader_program["scale"] = uniformScale(controller.zoom).reshape(16, 1, order="F")
-    shader_program["translate"] = translate(controller.x, controller.y, controller.z).reshape(16, 1, order="F")
-    rotation_matrix = rotate_x(controller.rotation_x) @ rotate_y(controller.rotation_y)
-    shader_program["rotate"] = rotation_matrix.reshape(16, 1, order="F")
+    if controller.culling:
+        update_visible()
+    program.use()
+    if uploaded_versions.get(program) != controller.version:
+        program["model"] = controller.model_matrix()
+        uploaded_versions[program] = controller.version
 
     gpu_data.draw(GL.GL_TRIANGLES)
+    frame_stats.count_draw(gpu_data.triangles)
+    frame_stats.times.append(time.perf_counter() - start)
+    if profiling.ENABLED:
+        # Tiempo de CPU del cuadro, como en el overlay (la GPU dibuja después)
+        profiling.record("vis.on_draw", frame_stats.times[-1])
+        profiling.count("vis.frames")
+        profiling.count("vis.triangles", gpu_data.triangles)
+
+    if controller.overlay:
+        # El texto se dibuja relleno y sobre el fractal
+        GL.glPolygonMode(GL.GL_FRONT_AND_BACK, GL.GL_FILL)
+        GL.glDisable(GL.GL_DEPTH_TEST)
+        overlay_label.text = frame_stats.text()
+        overlay_label.draw()
+        frame_stats.count_draw()
+    frame_stats.end_frame()
+    profiling.maybe_report()
 
 @win.event
 def on_key_press(symbol, modifiers):
-    global vertices, indices, gpu_data
-
     if symbol == pyglet.window.key.UP:
         controller.zoom = min(controller.zoom * 1.1, 10.0)  # Límite superior en zoom
     elif symbol == pyglet.window.key.DOWN:
@@ -109,21 +501,19 @@ def on_key_press(symbol, modifiers):
         controller.x += 0.1
     elif symbol == pyglet.window.key.RIGHT:
         controller.level += 1
-        vertices, indices = generate_sierpinsky3D(n=controller.level)
-        vertices = vertices.flatten()
-        gpu_data = shader_program.vertex_list_indexed(
-            len(vertices) // 3, GL.GL_TRIANGLES, indices.flatten().astype(np.uint32)
-        )
-        gpu_data.position[:] = vertices
+        show_level(controller.level)
     elif symbol == pyglet.window.key.LEFT:
         if controller.level > 0:
             controller.level -= 1
-            vertices, indices = generate_sierpinsky3D(n=controller.level)
-            vertices = vertices.flatten()
-            gpu_data = shader_program.vertex_list_indexed(
-                len(vertices) // 3, GL.GL_TRIANGLES, indices.flatten().astype(np.uint32)
-            )
-            gpu_data.position[:] = vertices
+            show_level(controller.level)
+    elif symbol == pyglet.window.key.I:
+        controller.instanced = not controller.instanced
+        show_level(controller.level)
+    elif symbol == pyglet.window.key.C:
+        controller.culling = not controller.culling
+        show_level(controller.level)
+    elif symbol == pyglet.window.key.F3:
+        controller.overlay = not controller.overlay
 
 
 @win.event
@@ -138,4 +528,6 @@ def on_mouse_release(x, y, button, modifiers):
     if button == pyglet.window.mouse.LEFT:
         controller.dragging = False
 
-pyglet.app.run()
\ No newline at end of file
+pyglet.app.run()
+level_cache.shutdown()
+visible_data.delete()